@@ -1,69 +1,208 @@
-from transformers import AutoTokenizer, AutoModelForTokenClassification, pipeline
-from spellchecker import SpellChecker
-from rapidfuzz import process
-import pandas as pd
-
-df = pd.read_csv(r"C:\Users\user\Downloads\dori_baza (1).csv")  # Fayl yo'lini to'g'ri kiritamiz
-kasallik_bazasi = df.groupby("Kasallik nomi")["Tavsiya etilgan dorilar"].apply(list).to_dict()
-
-
-model_name = "dbmdz/bert-large-cased-finetuned-conll03-english"
-tokenizer = AutoTokenizer.from_pretrained(model_name)
-model = AutoModelForTokenClassification.from_pretrained(model_name)
-ner_pipeline = pipeline("ner", model=model, tokenizer=tokenizer, aggregation_strategy="simple")
-
-
-spell = SpellChecker()
-barcha_dorilar = df["Tavsiya etilgan dorilar"].unique()
-spell.word_frequency.load_words([d.lower() for d in barcha_dorilar])
-
-kasallik = "asthma"  # Masalan, foydalanuvchi kiritgan kasallik nomi
-retsept = "The patient was prescribed Budeosonid."  # Foydalanuvchi kiritgan retsept
+"""Medication extraction from free-text prescriptions.
+
+A NER pipeline pulls medication names out of the prescription text, a spell
+checker fixes typos first, and each name is checked against the diagnosis'
+recommended medications from diseases.csv.
+
+Nothing is loaded at import time: the model, tokenizer and spell checker are
+built on the first call to ``predict_medication``/``predict_medications`` that
+has prescription text. Called with a diagnosis only, they just return its
+recommended medications and need no model.
+The model is read from NER_MODEL_DIR (default ``models/ner``) without network
+access. To populate it once:
+
+    python ai_model.py download
+"""
+import argparse
+import os
+import threading
+from functools import lru_cache
+
+from knowledge_base import DiagnosisKnowledgeBase
+from med_resolver import MedicationResolver
+
+MODEL_NAME = os.environ.get('NER_MODEL_NAME', "dbmdz/bert-large-cased-finetuned-conll03-english")
+MODEL_DIR = os.environ.get('NER_MODEL_DIR', os.path.join('models', 'ner'))
+DISEASES_CSV = os.environ.get('DISEASES_CSV', 'diseases.csv')
+# Prescriptions per NER forward pass
+BATCH_SIZE = int(os.environ.get('NER_BATCH_SIZE', 16))
+# Minimum similarity (0-100) to treat an unknown name as a misspelled recommended medication
+MATCH_SCORE = 80
+SPELL_CACHE_SIZE = 4096
+# Per-diagnosis resolvers kept, keyed by catalog diagnosis name
+RESOLVER_CACHE_SIZE = 256
+
+
+class MedicationNER:
+    """Lazily initialized NER + spell-check service."""
+
+    def __init__(self, model_dir=MODEL_DIR, csv_path=DISEASES_CSV, batch_size=BATCH_SIZE):
+        self.model_dir = model_dir
+        self.csv_path = csv_path
+        self.batch_size = batch_size
+        self._lock = threading.Lock()
+        self._pipeline = None
+        self._spell = None
+        self._knowledge_base = None
+        self._known = None
+        self._correct = lru_cache(maxsize=SPELL_CACHE_SIZE)(self._spell_correction)
+        self._resolver = lru_cache(maxsize=RESOLVER_CACHE_SIZE)(self._build_resolver)
+
+    @property
+    def loaded(self):
+        return self._pipeline is not None
+
+    # Diagnosis catalog only; enough for diagnosis-only predictions
+    def load_catalog(self):
+        if self._knowledge_base is not None:
+            return self
+        with self._lock:
+            if self._knowledge_base is None:
+                knowledge_base = DiagnosisKnowledgeBase(self.csv_path)
+                self._known = {med.lower() for med in knowledge_base.medications()}
+                self._knowledge_base = knowledge_base
+        return self
+
+    # Build everything once; concurrent first callers wait for the same load
+    def load(self):
+        if self._pipeline is not None:
+            return self
+        self.load_catalog()
+        with self._lock:
+            if self._pipeline is None:
+                if not os.path.isdir(self.model_dir):
+                    raise RuntimeError(f"NER model not found in {self.model_dir}; run 'python ai_model.py download'")
+                try:
+                    from spellchecker import SpellChecker
+                    from transformers import AutoModelForTokenClassification, AutoTokenizer, pipeline
+                except ImportError as e:
+                    raise RuntimeError(
+                        f"NER dependencies missing ({e.name}); install transformers and pyspellchecker") from e
+                spell = SpellChecker()
+                spell.word_frequency.load_words(self._known)
+                tokenizer = AutoTokenizer.from_pretrained(self.model_dir, local_files_only=True)
+                model = AutoModelForTokenClassification.from_pretrained(self.model_dir, local_files_only=True)
+                self._spell = spell
+                self._pipeline = pipeline("ner", model=model, tokenizer=tokenizer, aggregation_strategy="simple")
+        return self
+
+    def _spell_correction(self, word):
+        return self._spell.correction(word) or word
+
+    # Imlo tuzatish: only plain ASCII words that aren't already known medications
+    def correct_text(self, text):
+        words = []
+        for word in text.split():
+            if word.isalpha() and word.isascii() and word.lower() not in self._known:
+                word = self._correct(word)
+            words.append(word)
+        return " ".join(words)
+
+    # Merge word pieces ("Bude", "##sonid") into whole names
+    @staticmethod
+    def entity_words(entities):
+        words = []
+        for ent in entities:
+            word = ent["word"]
+            if word.startswith("##") and words:
+                words[-1] += word[2:]
+            else:
+                words.append(word)
+        return words
+
+    # Resolver over one diagnosis' recommended medications. Cached by the catalog
+    # entry (name + medications), never by raw client text, so the cache stays bounded.
+    @staticmethod
+    def _build_resolver(name, recommended):
+        return MedicationResolver(recommended, min_score=MATCH_SCORE)
+
+    def classify(self, diagnosis, medications):
+        entry = self._knowledge_base.lookup(diagnosis)
+        recommended = entry["recommended_meds"] if entry else []
+        recommended_lower = {med.lower() for med in recommended}
+        resolver = self._resolver(entry["name"] if entry else None, tuple(recommended))
+
+        to_gri, imlo_xato, notogri = [], [], []
+        for dori in medications:
+            if dori.lower() in recommended_lower:
+                to_gri.append(dori)
+                continue
+            best = resolver.best(dori)
+            if best is not None:
+                eng_yaqin, skor = best
+                imlo_xato.append({"medication": dori, "suggestion": eng_yaqin, "score": skor})
+            else:
+                notogri.append(dori)
+        return {
+            "diagnosis": diagnosis,
+            "diagnosis_found": entry is not None,
+            "recommended": list(recommended),
+            "correct": to_gri,
+            "misspelled": imlo_xato,
+            "incorrect": notogri,
+        }
+
+    # Score many (diagnosis, prescription text) pairs with batched NER calls.
+    # Items without text only get the diagnosis' recommended medications.
+    def predict_medications(self, items):
+        items = [(diagnosis, text or '') for diagnosis, text in items]
+        if any(text.strip() for _, text in items):
+            self.load()
+        else:
+            self.load_catalog()
+        corrected = [self.correct_text(text) if text.strip() else '' for _, text in items]
+        to_tag = [text for text in corrected if text]
+        tagged = iter(self._pipeline(to_tag, batch_size=self.batch_size) if to_tag else [])
+        results = []
+        for (diagnosis, _), text in zip(items, corrected):
+            medications = self.entity_words(next(tagged)) if text else []
+            result = self.classify(diagnosis, medications)
+            result["corrected_text"] = text
+            result["medications"] = medications
+            results.append(result)
+        return results
 
+    def predict_medication(self, diagnosis, prescription=None):
+        return self.predict_medications([(diagnosis, prescription)])[0]
 
-sozlar = retsept.split()
-tuzatilgan_sozlar = [spell.correction(soz) if soz.isalpha() and soz.lower() not in barcha_dorilar and soz.isascii() else soz for soz in sozlar]
-tuzatilgan_retsept = " ".join(tuzatilgan_sozlar)
 
-print("🛠 Imlo tuzatilgan retsept:", tuzatilgan_retsept)
+service = MedicationNER()
 
 
-ner_natija = ner_pipeline(tuzatilgan_retsept)
+def predict_medication(diagnosis, prescription=None):
+    return service.predict_medication(diagnosis, prescription)
 
 
-dorilar_retseptda = []
-for ent in ner_natija:
-    word = ent["word"]
-    if word.startswith("##"):
-        dorilar_retseptda[-1] += word[2:]
-    else:
-        dorilar_retseptda.append(word)
+def predict_medications(items):
+    return service.predict_medications(items)
 
 
-dori_baza = kasallik_bazasi.get(kasallik.lower(), [])
+# Fetch the model once so later loads work offline
+def download(model_name=MODEL_NAME, model_dir=MODEL_DIR):
+    from transformers import AutoModelForTokenClassification, AutoTokenizer
 
+    AutoTokenizer.from_pretrained(model_name).save_pretrained(model_dir)
+    AutoModelForTokenClassification.from_pretrained(model_name).save_pretrained(model_dir)
+    print(f"Saved {model_name} to {model_dir}")
 
-to_gri = []
-imlo_xato = []
-notogri = []
 
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Medication NER")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    download_parser = subparsers.add_parser('download', help='save the NER model to a local directory')
+    download_parser.add_argument('--model', default=MODEL_NAME)
+    download_parser.add_argument('--output', default=MODEL_DIR)
+    predict_parser = subparsers.add_parser('predict', help='check one prescription text')
+    predict_parser.add_argument('diagnosis')  # Masalan, "Astma"
+    predict_parser.add_argument('prescription')  # Masalan, "The patient was prescribed Budeosonid."
+    args = parser.parse_args()
 
-for dori in dorilar_retseptda:
-    if dori.lower() in [d.lower() for d in dori_baza]:
-        to_gri.append(dori)
+    if args.command == 'download':
+        download(args.model, args.output)
     else:
-        result = process.extractOne(dori, dori_baza)
-        if result:
-            eng_yaqin, skor, _ = result
-            if skor >= 80:
-                imlo_xato.append((dori, eng_yaqin, skor))
-            else:
-                notogri.append(dori)
-        else:
-            notogri.append(dori)
-
-
-print(f"📜 Retseptdagi dorilar: {dorilar_retseptda}")
-print(f"✅ To‘g‘ri dorilar: {to_gri}")
-print(f"✏️ Imlo xatolari: {imlo_xato}")
-print(f"❌ Noto‘g‘ri dorilar: {notogri}")
+        natija = predict_medication(args.diagnosis, args.prescription)
+        print("🛠 Imlo tuzatilgan retsept:", natija["corrected_text"])
+        print(f"📜 Retseptdagi dorilar: {natija['medications']}")
+        print(f"✅ To‘g‘ri dorilar: {natija['correct']}")
+        print(f"✏️ Imlo xatolari: {natija['misspelled']}")
+        print(f"❌ Noto‘g‘ri dorilar: {natija['incorrect']}")
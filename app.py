@@ -1,64 +1,86 @@
-from flask import Flask, request, render_template, redirect, url_for, flash, send_file, session
+from flask import Flask, request, render_template, redirect, url_for, flash, send_file, session, jsonify, abort
 from flask_sqlalchemy import SQLAlchemy
-import bcrypt
-import pandas as pd
-import pickle
+from werkzeug.middleware.proxy_fix import ProxyFix
+from sqlalchemy.orm import joinedload, selectinload
 import uuid
-import qrcode
+import click
 import io
-from datetime import datetime
-import os
-import requests
-import urllib.parse
-import time
 import json
+import logging
+from datetime import datetime, timedelta
+import os
+import scoring
+from knowledge_base import DiagnosisKnowledgeBase
+from med_resolver import MedicationResolver, load_aliases
+import pharmacy
+from audit import AuditWriter
+from auth import PasswordHasher, RateLimiter
+from cache import TTLCache
+from migrations import run_migrations, recompute_doctor_ratings
+from sequences import SequenceAllocator
+from database import configure_engine, database_url, engine_options
+from session_store import RedisSessionStore, SQLSessionStore, ServerSessionInterface, persistent_secret_key
+import instrumentation
+from pagination import keyset_page, per_page_arg, date_arg
+import bulk_io
+from model_server import ModelClient, load_model
+from model_artifact import model_version
+from confidence_matrix import ConfidenceMatrix
+from qr_cache import QRArtifactCache, MIMETYPES as QR_MIMETYPES
+from pharmacy import get_pharmacy_availability
+
+instrumentation.configure_logging()
+logger = logging.getLogger(__name__)
 
 app = Flask(__name__)
-app.config['SECRET_KEY'] = os.urandom(24).hex()
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///eprescription.db'
+# Same key in every worker: SECRET_KEY, or one generated once into the instance folder
+app.config['SECRET_KEY'] = (os.environ.get('SECRET_KEY')
+                            or persistent_secret_key(os.path.join(app.instance_path, 'secret_key')))
+app.config['SESSION_COOKIE_SAMESITE'] = 'Lax'
+app.config['SQLALCHEMY_DATABASE_URI'] = database_url('sqlite:///eprescription.db')
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(app.config['SQLALCHEMY_DATABASE_URI'])
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+# Number of reverse proxies in front of the app. Their X-Forwarded-For/-Proto is trusted, so
+# request.remote_addr (used by the login rate limit) is the real client. Leave at 0 when
+# clients connect directly, or they could spoof their address.
+PROXY_FIX_HOPS = int(os.environ.get('PROXY_FIX_HOPS', 0))
+if PROXY_FIX_HOPS:
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=PROXY_FIX_HOPS, x_proto=PROXY_FIX_HOPS)
 db = SQLAlchemy(app)
 
-# Load CSV and model
-df = pd.read_csv("diseases.csv", encoding='utf-8')
-with open('medication_model.pkl', 'rb') as f:
-    model = pickle.load(f)
-
-# Expanded mock pharmacy data
-PHARMACIES = [
-    {
-        "name": "Oson Apteka Chilanzar",
-        "address": "Tashkent, Chilanzar",
-        "regionId": 21,
-        "distance": 5.2,
-        "medications": ["Metformin", "Paracetamol", "Парастамик", "Beromed"],
-        "price": 15000
-    },
-    {
-        "name": "Samarqand Apteka",
-        "address": "Samarkand, Center",
-        "regionId": 22,
-        "distance": 10.0,
-        "medications": ["Paracetamol", "Beromed", "Metformin"],
-        "price": 18000
-    },
-    {
-        "name": "Buxoro Apteka",
-        "address": "Bukhara, Center",
-        "regionId": 23,
-        "distance": 15.0,
-        "medications": ["Парастамик", "Metformin"],
-        "price": 17000
-    },
-    {
-        "name": "Andijon Apteka",
-        "address": "Andijan, Center",
-        "regionId": 24,
-        "distance": 12.0,
-        "medications": ["Metformin", "Beromed"],
-        "price": 20000
-    }
-]
+# Load diagnosis index and model
+knowledge_base = DiagnosisKnowledgeBase("diseases.csv")
+MEDICATION_ALIASES = os.environ.get('MEDICATION_ALIASES', 'medication_aliases.csv')
+
+
+# Maps spelling variants ("metformin", "Amoxicillin") and aliases to catalog medication names
+def build_medication_resolver(kb):
+    return MedicationResolver(kb.medications(), min_score=float(os.environ.get('MEDICATION_MATCH_SCORE', 75)),
+                              aliases=load_aliases(MEDICATION_ALIASES))
+
+
+# Rebuilt whenever diseases.csv is reloaded; requests pick up the new one on their next lookup
+def reload_medication_resolver(kb):
+    global medication_resolver
+    medication_resolver = build_medication_resolver(kb)
+
+
+medication_resolver = build_medication_resolver(knowledge_base)
+knowledge_base.on_reload(reload_medication_resolver)
+
+MODEL_PATH = 'medication_model.pkl'
+MODEL_ARTIFACT_DIR = os.environ.get('MODEL_ARTIFACT_DIR', 'medication_model')
+if os.environ.get('MODEL_SERVER_URL'):
+    # Shared model server (model_server.py): workers don't each unpickle a copy
+    model = ModelClient(os.environ['MODEL_SERVER_URL'], fallback_path=MODEL_PATH,
+                        fallback_artifact_dir=MODEL_ARTIFACT_DIR)
+else:
+    model = load_model(MODEL_PATH, MODEL_ARTIFACT_DIR)
+
+# Precomputed scores for catalog diagnosis x medication pairs (confidence_matrix.py build);
+# skipped when it was built for a different model version
+confidence_matrix = ConfidenceMatrix.load(os.environ.get('CONFIDENCE_MATRIX', 'confidence_matrix.npz'),
+                                          expected_version=model_version(MODEL_PATH))
 
 
 # Database Models
@@ -68,11 +90,13 @@ class User(db.Model):
     password = db.Column(db.String(120), nullable=False)
     role = db.Column(db.String(20), nullable=False)  # doctor or admin
     rating = db.Column(db.Float, default=0.0)  # AI-based rating
+    rating_sum = db.Column(db.Float, nullable=False, default=0.0)  # Running sum of ai_score
+    rating_count = db.Column(db.Integer, nullable=False, default=0)  # Number of rated prescriptions
 
 
 class Prescription(db.Model):
     id = db.Column(db.String(36), primary_key=True)
-    patient_id = db.Column(db.String(50), nullable=False)
+    patient_id = db.Column(db.String(50), nullable=False, index=True)
     doctor_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     diagnosis = db.Column(db.String(100), nullable=False)
     symptoms = db.Column(db.Text)
@@ -90,6 +114,56 @@ class Prescription(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     doctor = db.relationship('User', backref='prescriptions')
 
+    medication_rows = db.relationship('PrescriptionMedication', order_by='PrescriptionMedication.position',
+                                      cascade='all, delete-orphan', back_populates='prescription')
+
+    __table_args__ = (
+        db.Index('ix_prescription_created_at_id', 'created_at', 'id'),
+        db.Index('ix_prescription_doctor_created_at', 'doctor_id', 'created_at'),
+    )
+
+    # Prescribed medications with confidence and flags, in entry order
+    @property
+    def prescribed_medications(self):
+        return [row for row in self.medication_rows if row.is_prescribed]
+
+    @property
+    def medication_list(self):
+        return [row.medication for row in self.prescribed_medications]
+
+    @property
+    def confidence_map(self):
+        return {row.medication: row.confidence for row in self.prescribed_medications}
+
+
+class PrescriptionMedication(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    prescription_id = db.Column(db.String(36), db.ForeignKey('prescription.id'), nullable=False, index=True)
+    position = db.Column(db.Integer, nullable=False, default=0)
+    medication = db.Column(db.String(100), nullable=False, index=True)
+    confidence = db.Column(db.Float)
+    is_prescribed = db.Column(db.Boolean, nullable=False, default=True)  # False: recommended but not prescribed
+    is_correct = db.Column(db.Boolean, nullable=False, default=False)
+    is_essential = db.Column(db.Boolean, nullable=False, default=False)  # In the diagnosis' recommended list
+    prescription = db.relationship('Prescription', back_populates='medication_rows')
+
+    # A medication needs attention if the AI rejected it or it isn't recommended
+    @property
+    def is_flagged(self):
+        return not self.is_correct or not self.is_essential
+
+
+class IdSequence(db.Model):
+    name = db.Column(db.String(50), primary_key=True)
+    value = db.Column(db.Integer, nullable=False, default=0)
+
+
+# Rows already committed by `flask import-prescriptions`, per source file
+class ImportCheckpoint(db.Model):
+    source = db.Column(db.String(255), primary_key=True)
+    rows_done = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
 
 class Comment(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -109,127 +183,220 @@ class AuditLog(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     user = db.relationship('User', backref='audit_logs')
 
+    __table_args__ = (
+        db.Index('ix_audit_log_created_at_id', 'created_at', 'id'),
+        db.Index('ix_audit_log_user_created_at', 'user_id', 'created_at'),
+        db.Index('ix_audit_log_action_created_at', 'action', 'created_at'),
+    )
+
 
-# Create database
+# Create database (WAL and busy timeout on every SQLite connection, see database.py)
 with app.app_context():
+    configure_engine(db.engine)
+    # Per-route timings at /metrics, optional sampling profiler (instrumentation.py)
+    instrumentation.init_app(app, db.engine)
     db.create_all()
+    run_migrations(db)
+    # Sessions are stored server-side so any worker can serve any request (session_store.py)
+    if os.environ.get('SESSION_REDIS_URL'):
+        session_backend = RedisSessionStore(os.environ['SESSION_REDIS_URL'])
+    else:
+        session_backend = SQLSessionStore(db.engine)
+    app.session_interface = ServerSessionInterface(
+        session_backend, lifetime=timedelta(seconds=float(os.environ.get('SESSION_LIFETIME', 12 * 3600))))
+
+# Rendered QR codes, shared on disk between workers
+qr_artifacts = QRArtifactCache(os.environ.get('QR_CACHE_DIR', os.path.join(app.instance_path, 'qr')),
+                               max_items=int(os.environ.get('QR_CACHE_SIZE', 1024)),
+                               max_disk_items=int(os.environ.get('QR_CACHE_DISK_ITEMS', 100000)))
+# Scheme and host patient QR links point to (e.g. https://rx.example.org). Without it the
+# request's host is used and those QR codes are only cached in memory.
+PUBLIC_BASE_URL = os.environ.get('PUBLIC_BASE_URL', '').rstrip('/')
+
+# bcrypt runs in a bounded pool at BCRYPT_ROUNDS; limits are checked before any hashing
+password_hasher = PasswordHasher(workers=int(os.environ['AUTH_WORKERS']) if 'AUTH_WORKERS' in os.environ else None,
+                                 kind=os.environ.get('AUTH_POOL', 'process'),
+                                 max_pending=int(os.environ['AUTH_MAX_PENDING']) if 'AUTH_MAX_PENDING' in os.environ
+                                 else None)
+# Keyed on the client address, so a whole clinic behind one NAT shares the budget; behind a
+# reverse proxy set PROXY_FIX_HOPS (below) or every login counts against the proxy's address
+login_ip_limiter = RateLimiter(int(os.environ.get('LOGIN_LIMIT_PER_IP', 300)), window=60)
+login_failure_limiter = RateLimiter(int(os.environ.get('LOGIN_FAILURES_PER_USER', 5)),
+                                    window=float(os.environ.get('LOGIN_FAILURE_WINDOW', 300)))
+
+# user id -> {id, username, role}, so role checks don't hit the database on every request.
+# Per worker; a changed role or deleted user takes effect within USER_CACHE_TTL seconds.
+user_cache = TTLCache(maxsize=int(os.environ.get('USER_CACHE_SIZE', 10000)),
+                      ttl=float(os.environ.get('USER_CACHE_TTL', 60)), negative_ttl=10, stale_ttl=0)
+
+
+def user_identity(user):
+    return {"id": user.id, "username": user.username, "role": user.role}
+
+
+def load_user_identity(user_id):
+    user = db.session.execute(db.select(User.id, User.username, User.role).where(User.id == user_id)).first()
+    return user_identity(user) if user is not None else None
+
+
+# The logged-in user as {id, username, role}, or None
+def current_user():
+    user_id = session.get('user_id')
+    if user_id is None:
+        return None
+    return user_cache.get_or_load(user_id, lambda: load_user_identity(user_id), is_negative=lambda user: user is None)
 
 
-# Update doctor rating
-def update_doctor_rating(doctor_id):
-    prescriptions = Prescription.query.filter_by(doctor_id=doctor_id).all()
-    if prescriptions:
-        total_score = sum(p.ai_score for p in prescriptions)
-        rating = total_score / len(prescriptions)
-        doctor = User.query.get(doctor_id)
-        doctor.rating = rating
-        db.session.commit()
+def has_role(role):
+    user = current_user()
+    return user is not None and user['role'] == role
+
+
+@app.context_processor
+def inject_current_user():
+    return {'current_user': current_user()}
+
+
+# Patient ids come from a counter row; each worker reserves PATIENT_ID_BLOCK ids at a time
+patient_ids = SequenceAllocator(db, 'patient_id', block_size=int(os.environ.get('PATIENT_ID_BLOCK', 1)))
+
+# Audit events are written in batches off the request path; AUDIT_MODE=sync writes them inline
+audit_writer = AuditWriter(
+    app, db, AuditLog,
+    mode=os.environ.get('AUDIT_MODE', 'async'),
+    maxsize=int(os.environ.get('AUDIT_QUEUE_SIZE', 10000)),
+    overflow=os.environ.get('AUDIT_OVERFLOW', 'block'),
+)
+
+
+# Add one prescription's score to the doctor's running rating.
+# Runs in the caller's transaction, so commit it together with the prescription.
+def update_doctor_rating(doctor_id, ai_score):
+    db.session.execute(
+        db.update(User)
+        .where(User.id == doctor_id)
+        .values(rating_sum=User.rating_sum + ai_score,
+                rating_count=User.rating_count + 1,
+                rating=(User.rating_sum + ai_score) / (User.rating_count + 1))
+    )
+
+
+# Apply many scores in one executemany UPDATE; totals is {doctor_id: (score_sum, count)}
+def update_doctor_ratings(totals):
+    if not totals:
+        return
+    user = User.__table__
+    score_sum, scored = db.bindparam('score_sum'), db.bindparam('scored')
+    db.session.execute(
+        user.update()
+        .where(user.c.id == db.bindparam('doctor'))
+        .values(rating_sum=user.c.rating_sum + score_sum,
+                rating_count=user.c.rating_count + scored,
+                rating=(user.c.rating_sum + score_sum) / (user.c.rating_count + scored)),
+        [{"doctor": doctor_id, "score_sum": total, "scored": count} for doctor_id, (total, count) in totals.items()]
+    )
+
+
+# Column values for a scored prescription
+def prescription_values(diagnosis, symptoms, medications, result, **fields):
+    return dict(
+        fields,
+        diagnosis=diagnosis,
+        symptoms=symptoms,
+        medications=','.join(medications),
+        ai_score=result["ai_score"],
+        correct_meds=','.join(result["correct_meds"]),
+        incorrect_meds=','.join(result["incorrect_meds"]),
+        essential_meds=','.join(result["essential_meds"]),
+        non_essential_meds=','.join(result["non_essential_meds"]),
+        confidence_scores=','.join(f"{med}:{result['confidence'][med]:.2f}" for med in medications),
+    )
 
 
-# Fetch pharmacy data from API
-def fetch_pharmacy_data(medication):
-    url = "https://osonapteka.uz/api/web/Product/Search"
-    payload = {
-        "pageSize": 20,
-        "page": 1,
-        "searchText": medication,
-        "showOnlyExistonStore": True
+# Child row values for a scored prescription: prescribed meds first, then recommended ones that were left out.
+# Names are compared in their catalog spelling, as scoring.evaluate does.
+def medication_row_values(medications, result, resolver=None):
+    correct = set(result["correct_meds"])
+    essential = {scoring.canonical(med, resolver) for med in result["essential_meds"]}
+    prescribed = {scoring.canonical(med, resolver) for med in medications}
+    rows = [dict(position=i, medication=med, confidence=result["confidence"][med],
+                 is_prescribed=True, is_correct=med in correct,
+                 is_essential=scoring.canonical(med, resolver) in essential)
+            for i, med in enumerate(medications)]
+    missing = [med for med in result["essential_meds"] if scoring.canonical(med, resolver) not in prescribed]
+    rows.extend(dict(position=len(medications) + i, medication=med, confidence=None,
+                     is_prescribed=False, is_correct=False, is_essential=True)
+                for i, med in enumerate(missing))
+    return rows
+
+
+def build_medication_rows(medications, result, resolver=None):
+    return [PrescriptionMedication(**values) for values in medication_row_values(medications, result, resolver)]
+
+
+# Query helpers that load the relationships listing templates dereference, so
+# rendering N rows doesn't issue N extra SELECTs
+def prescriptions_query():
+    return Prescription.query.options(joinedload(Prescription.doctor), selectinload(Prescription.medication_rows))
+
+
+def audit_logs_query():
+    return AuditLog.query.options(joinedload(AuditLog.user))
+
+
+# Action names for the audit log filter. DISTINCT scans the whole (ever-growing) table, so the
+# list is reloaded at most every AUDIT_ACTIONS_TTL seconds per worker instead of on each page view
+audit_actions_cache = TTLCache(maxsize=1, ttl=float(os.environ.get('AUDIT_ACTIONS_TTL', 600)), stale_ttl=0)
+
+
+def audit_actions():
+    return audit_actions_cache.get_or_load('actions', lambda: [
+        row[0] for row in db.session.query(AuditLog.action).distinct().order_by(AuditLog.action)])
+
+
+def comments_query():
+    return Comment.query.options(joinedload(Comment.doctor))
+
+
+# Listing filters from the query string
+def listing_filters():
+    return {
+        'doctor_id': request.args.get('doctor_id', type=int),
+        'user_id': request.args.get('user_id', type=int),
+        'action': request.args.get('action', '').strip(),
+        'medication': request.args.get('medication', '').strip(),
+        'date_from': request.args.get('date_from', ''),
+        'date_to': request.args.get('date_to', ''),
     }
-    headers = {'Content-Type': 'application/json'}
-    for attempt in range(3):
-        try:
-            response = requests.post(url, json=payload, headers=headers, timeout=5, verify=False)
-            response.raise_for_status()
-            raw_data = response.json()
-            print(f"API raw response for {medication}: {json.dumps(raw_data, ensure_ascii=False)}")
-            data = raw_data.get('data', []) if isinstance(raw_data, dict) else []
-            print(f"API success for {medication}: {len(data)} results")
-            return data
-        except requests.RequestException as e:
-            print(f"API error for {medication}: {e}")
-            time.sleep(1)
-    # Fallback to mock data
-    mock_data = [
-        {
-            "medication": medication,
-            "pharmacy": p,
-            "inStock": medication in p["medications"],
-            "price": p["price"]
-        } for p in PHARMACIES if medication in p["medications"]
-    ]
-    print(f"Using mock data for {medication}: {len(mock_data)} results")
-    return mock_data
-
-
-# Aggregate pharmacy data
-def get_pharmacy_availability(medications):
-    pharmacies = {}
-    for med in medications:
-        results = fetch_pharmacy_data(med)
-        for result in results:
-            try:
-                # Handle string results (e.g., API returns list of medication names)
-                if isinstance(result, str):
-                    print(f"Unexpected string result for {med}: {result}")
-                    # Assume string is medication name, use mock-like structure
-                    for p in PHARMACIES:
-                        if med in p["medications"]:
-                            name = p["name"]
-                            pharmacies[name] = {
-                                "name": name,
-                                "address": p["address"],
-                                "regionId": p["regionId"],
-                                "distance": p["distance"],
-                                "available_meds": [med],
-                                "total_price": p["price"],
-                                "all_meds_available": False,
-                                "link": f"https://osonapteka.uz/search?query={urllib.parse.quote(med)}"
-                            }
-                    continue
-
-                # Handle dictionary results
-                med_name = result.get('medication', med) if isinstance(result, dict) else med
-                pharmacy_info = result.get('pharmacy', {}) if isinstance(result, dict) else {}
-                name = pharmacy_info.get('name', 'Unknown Pharmacy')
-                address = pharmacy_info.get('address', 'Unknown Address')
-                regionId = pharmacy_info.get('regionId', 0)
-                price = pharmacy_info.get('price', 999999)
-                inStock = result.get('inStock', False) if isinstance(result, dict) else True
-
-                if name not in pharmacies:
-                    pharmacies[name] = {
-                        "name": name,
-                        "address": address,
-                        "regionId": regionId,
-                        "distance": pharmacy_info.get('distance', 9999),
-                        "available_meds": [],
-                        "total_price": 0,
-                        "all_meds_available": False,
-                        "link": f"https://osonapteka.uz/search?query={urllib.parse.quote(med)}"
-                    }
-                if inStock:
-                    pharmacies[name]["available_meds"].append(med_name)
-                    pharmacies[name]["total_price"] += price
-            except (KeyError, TypeError) as e:
-                print(f"Error parsing API result for {med}: {e}")
-                continue
-
-    # Check if all medications are available
-    pharmacy_list = list(pharmacies.values())
-    for p in pharmacy_list:
-        p["all_meds_available"] = set(p["available_meds"]) == set(medications)
-        p["distance"] = float(p["distance"]) if p["distance"] else 9999
-        p["total_price"] = float(p["total_price"]) if p["total_price"] else 999999
-        p["regionId"] = int(p["regionId"]) if p["regionId"] else 0
-
-    print(f"Aggregated {len(pharmacy_list)} pharmacies: {[p['name'] for p in pharmacy_list]}")
-    return pharmacy_list
+
+
+# Restrict created_at to [date_from, date_to] (both inclusive days)
+def filter_created_at(query, model, filters):
+    date_from = date_arg(filters['date_from'])
+    date_to = date_arg(filters['date_to'])
+    if date_from:
+        query = query.filter(model.created_at >= date_from)
+    if date_to:
+        query = query.filter(model.created_at < date_to + timedelta(days=1))
+    return query
+
+
+def filter_prescriptions(query, filters):
+    if filters['doctor_id']:
+        query = query.filter(Prescription.doctor_id == filters['doctor_id'])
+    if filters['medication']:
+        query = query.filter(Prescription.id.in_(
+            db.select(PrescriptionMedication.prescription_id)
+            .where(PrescriptionMedication.medication == filters['medication'],
+                   PrescriptionMedication.is_prescribed.is_(True))
+        ))
+    return filter_created_at(query, Prescription, filters)
 
 
 # Routes
 @app.route('/')
 def index():
-    if 'user_id' in session:
+    if current_user() is not None:
         return redirect(url_for('dashboard'))
     return redirect(url_for('login'))
 
@@ -240,15 +407,22 @@ def register():
         username = request.form['username']
         password = request.form['password']
         role = request.form['role']
-        print(f"Register attempt: username={username}, role={role}")
+        logger.info("Register attempt", extra={"username": username, "role": role})
+        if not login_ip_limiter.hit(request.remote_addr or 'unknown'):
+            flash('Too many attempts, please try again later.', 'danger')
+            return render_template('register.html'), 429
         if User.query.filter_by(username=username).first():
             flash('Username already exists!', 'danger')
         else:
-            hashed = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt())
+            try:
+                hashed = password_hasher.hash(password)
+            except TimeoutError:
+                flash('Server is busy, please try again.', 'danger')
+                return render_template('register.html'), 503
             user = User(username=username, password=hashed, role=role)
             db.session.add(user)
             db.session.commit()
-            print(f"User registered: {username}")
+            logger.info("User registered", extra={"username": username})
             flash('Registration successful! Please log in.', 'success')
             return redirect(url_for('login'))
     return render_template('register.html')
@@ -259,103 +433,125 @@ def login():
     if request.method == 'POST':
         username = request.form['username']
         password = request.form['password']
-        print(f"Login attempt: username={username}")
+        client_ip = request.remote_addr or 'unknown'
+        if not login_ip_limiter.hit(client_ip) or not login_failure_limiter.allowed(username):
+            logger.warning("Login rate limited", extra={"username": username, "client_ip": client_ip})
+            flash('Too many login attempts, please try again later.', 'danger')
+            response = app.make_response((render_template('login.html'), 429))
+            response.headers['Retry-After'] = str(max(login_ip_limiter.retry_after(client_ip),
+                                                      login_failure_limiter.retry_after(username), 1))
+            return response
         user = User.query.filter_by(username=username).first()
         if user:
-            print(f"User found: {user.username}, role={user.role}")
-            if bcrypt.checkpw(password.encode('utf-8'), user.password):
+            try:
+                valid = password_hasher.verify(password, user.password)
+            except TimeoutError:
+                flash('Server is busy, please try again.', 'danger')
+                return render_template('login.html'), 503
+            if valid:
+                if password_hasher.needs_rehash(user.password):
+                    # BCRYPT_ROUNDS changed since this hash was made; if the pool is busy the
+                    # upgrade waits for a later login
+                    try:
+                        user.password = password_hasher.hash(password)
+                        db.session.commit()
+                    except TimeoutError:
+                        logger.warning("Password rehash skipped, hasher busy", extra={"user_id": user.id})
+                login_failure_limiter.reset(username)
+                # Only the id goes in the session; username and role come from user_cache
+                session.clear()
+                session.regenerate()
                 session['user_id'] = user.id
-                session['username'] = user.username
-                session['role'] = user.role
-                print(f"Session set: {session}")
+                user_cache.set(user.id, user_identity(user))
+                logger.info("Login succeeded", extra={"user_id": user.id, "role": user.role})
                 flash('Logged in successfully!', 'success')
-                audit_log = AuditLog(user_id=user.id, action="Login", details=f"User {username} logged in")
-                db.session.add(audit_log)
-                db.session.commit()
+                audit_writer.log(user_id=user.id, action="Login", details=f"User {username} logged in")
                 return redirect(url_for('dashboard'))
+        login_failure_limiter.add(username)
         flash('Invalid credentials!', 'danger')
-        print("Login failed: Invalid credentials")
+        logger.info("Login failed", extra={"username": username})
     return render_template('login.html')
 
 
 @app.route('/logout')
 def logout():
-    user_id = session.get('user_id')
-    username = session.get('username')
-    session.pop('user_id', None)
-    session.pop('username', None)
-    session.pop('role', None)
+    user = current_user()
+    user_id = user['id'] if user else None
+    username = user['username'] if user else None
+    session.clear()
+    session.regenerate()
     flash('Logged out successfully!', 'success')
-    audit_log = AuditLog(user_id=user_id, action="Logout", details=f"User {username} logged out")
-    db.session.add(audit_log)
-    db.session.commit()
+    audit_writer.log(user_id=user_id, action="Logout", details=f"User {username} logged out")
     return redirect(url_for('login'))
 
 
 @app.route('/dashboard')
 def dashboard():
-    if 'user_id' not in session:
+    user = current_user()
+    if user is None:
         flash('Please log in!', 'danger')
-        print("Dashboard access denied: No user_id in session")
         return redirect(url_for('login'))
-    print(f"Dashboard accessed: role={session['role']}")
-    audit_log = AuditLog(user_id=session['user_id'], action="Access Dashboard",
-                         details=f"User accessed dashboard, role={session['role']}")
-    db.session.add(audit_log)
-    db.session.commit()
-    if session['role'] == 'admin':
+    audit_writer.log(user_id=user['id'], action="Access Dashboard",
+                     details=f"User accessed dashboard, role={user['role']}")
+    if user['role'] == 'admin':
         return redirect(url_for('admin_dashboard'))
     return redirect(url_for('doctor_dashboard'))
 
 
 @app.route('/doctor')
 def doctor_dashboard():
-    if 'user_id' not in session or session['role'] != 'doctor':
+    if not has_role('doctor'):
         flash('Access denied!', 'danger')
-        print("Doctor dashboard access denied")
         return redirect(url_for('login'))
     user_id = session['user_id']
-    prescriptions = Prescription.query.filter_by(doctor_id=user_id).all()
-    print(f"Doctor dashboard: user_id={user_id}, prescriptions={len(prescriptions)}")
-    audit_log = AuditLog(user_id=user_id, action="Access Doctor Dashboard",
-                         details=f"Doctor viewed dashboard with {len(prescriptions)} prescriptions")
-    db.session.add(audit_log)
-    db.session.commit()
+    prescriptions = prescriptions_query().filter_by(doctor_id=user_id).all()
+    audit_writer.log(user_id=user_id, action="Access Doctor Dashboard",
+                     details=f"Doctor viewed dashboard with {len(prescriptions)} prescriptions")
     return render_template('doctor_dashboard.html', prescriptions=prescriptions)
 
 
 @app.route('/admin')
 def admin_dashboard():
-    if 'user_id' not in session or session['role'] != 'admin':
+    if not has_role('admin'):
         flash('Access denied!', 'danger')
-        print("Admin dashboard access denied")
         return redirect(url_for('login'))
-    prescriptions = Prescription.query.all()
+    filters = listing_filters()
+    prescriptions, next_cursor = keyset_page(filter_prescriptions(prescriptions_query(), filters), Prescription,
+                                             request.args.get('cursor'), per_page_arg(request.args.get('per_page')))
     doctors = User.query.filter_by(role='doctor').all()
     user_count = User.query.count()
     prescription_count = Prescription.query.count()
     comment_count = Comment.query.count()
     audit_log_count = AuditLog.query.count()
-    print(f"Admin dashboard: prescriptions={len(prescriptions)}, doctors={len(doctors)}")
-    audit_log = AuditLog(user_id=session['user_id'], action="Access Admin Dashboard",
-                         details=f"Admin viewed dashboard with {len(prescriptions)} prescriptions")
-    db.session.add(audit_log)
-    db.session.commit()
+    audit_writer.log(user_id=session['user_id'], action="Access Admin Dashboard",
+                     details=f"Admin viewed dashboard with {prescription_count} prescriptions")
     return render_template('admin_dashboard.html', prescriptions=prescriptions, doctors=doctors,
                            user_count=user_count, prescription_count=prescription_count,
-                           comment_count=comment_count, audit_log_count=audit_log_count)
+                           comment_count=comment_count, audit_log_count=audit_log_count,
+                           filters=filters, next_cursor=next_cursor)
+
+
+@app.route('/admin/recompute_ratings', methods=['POST'])
+def recompute_ratings():
+    if not has_role('admin'):
+        flash('Access denied!', 'danger')
+        return redirect(url_for('login'))
+    with db.engine.begin() as conn:
+        doctors = recompute_doctor_ratings(conn)
+    audit_writer.log(user_id=session['user_id'], action="Recompute Ratings",
+                     details=f"Admin recomputed ratings for {doctors} doctors")
+    flash('Reytinglar qayta hisoblandi!', 'success')
+    return redirect(url_for('admin_dashboard'))
 
 
 @app.route('/create_prescription', methods=['GET', 'POST'])
 def create_prescription():
-    if 'user_id' not in session or session['role'] != 'doctor':
+    if not has_role('doctor'):
         flash('Access denied!', 'danger')
         return redirect(url_for('login'))
 
     if request.method == 'POST':
         prescription_id = str(uuid.uuid4())
-        last_prescription = Prescription.query.order_by(Prescription.patient_id.desc()).first()
-        patient_id = str(int(last_prescription.patient_id) + 1) if last_prescription else '1'
         diagnosis = request.form['diagnosis']
         symptoms = request.form.get('symptoms', '')
         medications_input = request.form['medications']
@@ -369,63 +565,30 @@ def create_prescription():
             flash('Kamida bitta dori kiritish kerak!', 'danger')
             return render_template('create_prescription.html')
 
-        match = df[df['Kasallik nomi'].str.lower() == diagnosis.lower()]
-        if not match.empty:
-            row = match.iloc[0]
-            recommended_meds = [med.strip() for med in row['Tavsiya etilgan dorilar'].split(',')]
-            feature_input = f"{diagnosis} {symptoms}"
-
-            correct_meds = []
-            incorrect_meds = []
-            confidence_scores = []
-            confidence_dict = {}
-            for med in medications:
-                prediction = model.predict_proba([f"{feature_input} {med}"])[0]
-                is_correct_prob = prediction[1]
-                confidence_dict[med] = is_correct_prob
-                if med in recommended_meds or is_correct_prob > 0.7:
-                    correct_meds.append(med)
-                    confidence_scores.append(is_correct_prob)
-                else:
-                    incorrect_meds.append(med)
-
-            ai_score = int((len(correct_meds) / len(medications)) * 100) if medications else 0
-            if confidence_scores:
-                ai_score = min(ai_score, int(sum(confidence_scores) / len(confidence_scores) * 100))
-
-            essential_meds = recommended_meds
-            non_essential_meds = [med for med in medications if med not in recommended_meds]
-            confidence_str = ','.join([f"{med}:{confidence_dict[med]:.2f}" for med in medications])
+        entry = knowledge_base.lookup(diagnosis)
+        if entry is not None:
+            recommended_meds = entry['recommended_meds']
+            with instrumentation.timed('model'):
+                confidence_dict = scoring.score_medications(model, diagnosis, symptoms, medications,
+                                                            confidence_matrix, medication_resolver)
+            result = scoring.evaluate(medications, recommended_meds, confidence_dict, medication_resolver)
 
+            patient_id = str(patient_ids.next())
             prescription = Prescription(
-                id=prescription_id,
-                patient_id=patient_id,
-                doctor_id=session['user_id'],
-                diagnosis=diagnosis,
-                symptoms=symptoms,
-                medications=','.join(medications),
-                drug_type=drug_type,
-                duration=duration,
-                usage=usage,
-                info=info,
-                ai_score=ai_score,
-                correct_meds=','.join(correct_meds),
-                incorrect_meds=','.join(incorrect_meds),
-                essential_meds=','.join(essential_meds),
-                non_essential_meds=','.join(non_essential_meds),
-                confidence_scores=confidence_str
+                medication_rows=build_medication_rows(medications, result, medication_resolver),
+                **prescription_values(diagnosis, symptoms, medications, result, id=prescription_id,
+                                      patient_id=patient_id, doctor_id=session['user_id'], drug_type=drug_type,
+                                      duration=duration, usage=usage, info=info)
             )
             db.session.add(prescription)
+            update_doctor_rating(session['user_id'], result["ai_score"])
             db.session.commit()
-            update_doctor_rating(session['user_id'])
-            audit_log = AuditLog(
+            audit_writer.log(
                 user_id=session['user_id'],
                 action="Create Prescription",
                 prescription_id=prescription_id,
                 details=f"Prescription created for patient {patient_id}, diagnosis: {diagnosis}"
             )
-            db.session.add(audit_log)
-            db.session.commit()
             flash('Retsept muvaffaqiyatli yaratildi!', 'success')
             return redirect(url_for('doctor_dashboard'))
         else:
@@ -434,118 +597,391 @@ def create_prescription():
     return render_template('create_prescription.html')
 
 
+@app.route('/api/score', methods=['POST'])
+def score_prescriptions():
+    if not has_role('doctor'):
+        return jsonify({'error': 'Access denied'}), 403
+    data = request.get_json(silent=True) or {}
+    items = data.get('prescriptions')
+    if not isinstance(items, list):
+        return jsonify({'error': "'prescriptions' list is required"}), 400
+
+    requests_batch = []
+    for index, item in enumerate(items):
+        if not isinstance(item, dict):
+            return jsonify({'error': f"prescriptions[{index}] must be an object"}), 400
+        medications = item.get('medications', [])
+        if not isinstance(medications, list) or not all(isinstance(med, str) for med in medications):
+            return jsonify({'error': f"prescriptions[{index}].medications must be a list of strings"}), 400
+        diagnosis = item.get('diagnosis', '')
+        symptoms = item.get('symptoms', '')
+        if not isinstance(diagnosis, str) or not isinstance(symptoms, str):
+            return jsonify({'error': f"prescriptions[{index}].diagnosis and symptoms must be strings"}), 400
+        medications = [med.strip() for med in medications if med.strip()]
+        requests_batch.append((diagnosis, symptoms, medications))
+
+    results = []
+    with instrumentation.timed('model'):
+        scored = scoring.score_batch(model, requests_batch, confidence_matrix, medication_resolver)
+    for (diagnosis, _, medications), confidence_dict in zip(requests_batch, scored):
+        entry = knowledge_base.lookup(diagnosis)
+        recommended_meds = entry['recommended_meds'] if entry else []
+        result = scoring.evaluate(medications, recommended_meds, confidence_dict, medication_resolver)
+        result['diagnosis'] = diagnosis
+        result['diagnosis_found'] = entry is not None
+        results.append(result)
+    return jsonify({'results': results})
+
+
 @app.route('/prescriptions')
 def view_prescriptions():
-    if 'user_id' not in session or session['role'] != 'doctor':
+    if not has_role('doctor'):
         flash('Access denied!', 'danger')
         return redirect(url_for('login'))
-    prescriptions = Prescription.query.all()
-    audit_log = AuditLog(
+    filters = listing_filters()
+    prescriptions, next_cursor = keyset_page(filter_prescriptions(prescriptions_query(), filters), Prescription,
+                                             request.args.get('cursor'), per_page_arg(request.args.get('per_page')))
+    doctors = User.query.filter_by(role='doctor').all()
+    audit_writer.log(
         user_id=session['user_id'],
         action="View All Prescriptions",
-        details=f"User viewed all prescriptions, total: {len(prescriptions)}"
+        details=f"User viewed prescriptions page, shown: {len(prescriptions)}"
     )
-    db.session.add(audit_log)
-    db.session.commit()
-    return render_template('view_prescriptions.html', prescriptions=prescriptions)
+    return render_template('view_prescriptions.html', prescriptions=prescriptions, doctors=doctors,
+                           filters=filters, next_cursor=next_cursor)
 
 
 @app.route('/prescription/<id>', methods=['GET', 'POST'])
 def prescription_details(id):
     prescription = Prescription.query.get_or_404(id)
-    comments = Comment.query.filter_by(prescription_id=id).all()
+    comments = comments_query().filter_by(prescription_id=id).all()
 
-    if request.method == 'POST' and 'user_id' in session and session['role'] == 'doctor':
+    if request.method == 'POST' and has_role('doctor'):
         text = request.form['comment']
         comment = Comment(prescription_id=id, doctor_id=session['user_id'], text=text)
         db.session.add(comment)
         db.session.commit()
-        audit_log = AuditLog(
+        audit_writer.log(
             user_id=session['user_id'],
             action="Add Comment",
             prescription_id=id,
             details=f"Comment added to prescription {id}: {text[:50]}..."
         )
-        db.session.add(audit_log)
-        db.session.commit()
         flash('Izoh qo\'shildi!', 'success')
         return redirect(url_for('prescription_details', id=id))
 
-    audit_log = AuditLog(
+    audit_writer.log(
         user_id=session.get('user_id'),
         action="View Prescription Details",
         prescription_id=id,
         details=f"User viewed prescription {id}"
     )
-    db.session.add(audit_log)
-    db.session.commit()
     return render_template('prescription_details.html', prescription=prescription, comments=comments)
 
 
 @app.route('/prescription/<id>/print')
 def print_prescription(id):
     prescription = Prescription.query.get_or_404(id)
-    audit_log = AuditLog(
+    audit_writer.log(
         user_id=session.get('user_id'),
         action="View Print Page",
         prescription_id=id,
         details=f"User accessed print page for prescription {id}"
     )
-    db.session.add(audit_log)
-    db.session.commit()
     return render_template('print_prescription.html', prescription=prescription)
 
 
 @app.route('/prescription/<id>/qr')
 def generate_qr(id):
-    prescription = Prescription.query.get_or_404(id)
-    qr = qrcode.QRCode(version=1, box_size=10, border=5)
-    qr.add_data(url_for('patient_view', prescription_id=id, _external=True))
-    qr.make(fit=True)
-    img = qr.make_image(fill='black', back_color='white')
-    img_io = io.BytesIO()
-    img.save(img_io, 'PNG')
-    img_io.seek(0)
-    audit_log = AuditLog(
+    if db.session.query(Prescription.id).filter_by(id=id).first() is None:
+        abort(404)
+    fmt = request.args.get('format', 'png')
+    if fmt not in QR_MIMETYPES:
+        abort(400)
+    base_url = PUBLIC_BASE_URL or request.host_url.rstrip('/')
+    content, etag = qr_artifacts.get(id, base_url, url_for('patient_view', prescription_id=id), fmt,
+                                     persist=bool(PUBLIC_BASE_URL))
+    audit_writer.log(
         user_id=session.get('user_id'),
         action="Generate QR Code",
         prescription_id=id,
         details=f"QR code generated for prescription {id}"
     )
-    db.session.add(audit_log)
-    db.session.commit()
-    return send_file(img_io, mimetype='image/png')
+    response = send_file(io.BytesIO(content), mimetype=QR_MIMETYPES[fmt], etag=False)
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'public, max-age=86400'
+    return response.make_conditional(request)
+
+
+# Pre-render QR codes for printing batches: flask --app app prerender-qr --base-url https://host
+@app.cli.command('prerender-qr')
+@click.option('--base-url', default=None, help='Scheme and host the QR codes point to (default: PUBLIC_BASE_URL)')
+@click.option('--format', 'fmt', type=click.Choice(sorted(QR_MIMETYPES)), default='png')
+@click.option('--since', default=None, help='Only prescriptions created on or after YYYY-MM-DD')
+def prerender_qr(base_url, fmt, since):
+    base_url = (base_url or PUBLIC_BASE_URL).rstrip('/')
+    if not base_url:
+        raise click.UsageError('Pass --base-url or set PUBLIC_BASE_URL')
+    query = db.session.query(Prescription.id)
+    since_date = date_arg(since)
+    if since_date:
+        query = query.filter(Prescription.created_at >= since_date)
+    count = 0
+    with app.test_request_context():
+        for (prescription_id,) in query.yield_per(500):
+            qr_artifacts.get(prescription_id, base_url, url_for('patient_view', prescription_id=prescription_id), fmt)
+            count += 1
+    click.echo(f"Pre-rendered {count} QR codes ({fmt}) into {qr_artifacts.directory}")
+
+
+# Doctor ids for the chunk's "doctor" (username) / "doctor_id" values, one query for any not seen before
+def resolve_doctors(records, by_name, by_id):
+    names = {str(r['doctor']).strip() for r in records if r.get('doctor')} - set(by_name)
+    ids = {str(r['doctor_id']).strip() for r in records if r.get('doctor_id') and not r.get('doctor')}
+    # Usernames and ids are kept apart so a doctor named "5" is never taken for id 5
+    numeric_ids = {int(i) for i in ids if i.isascii() and i.isdigit()} - set(by_id)
+    if names or numeric_ids:
+        doctors = User.query.filter(User.role == 'doctor',
+                                    db.or_(User.username.in_(names), User.id.in_(numeric_ids))).all()
+        for doctor in doctors:
+            if doctor.username in names:
+                by_name[doctor.username] = doctor.id
+            if doctor.id in numeric_ids:
+                by_id[doctor.id] = doctor.id
+    for name in names:
+        by_name.setdefault(name, None)
+    for doctor_id in numeric_ids:
+        by_id.setdefault(doctor_id, None)
+
+
+# Doctor id for an import record: by username when given, else by numeric doctor_id
+def record_doctor_id(record, by_name, by_id):
+    if record.get('doctor'):
+        return by_name.get(str(record['doctor']).strip())
+    doctor_id = str(record.get('doctor_id') or '').strip()
+    return by_id.get(int(doctor_id)) if doctor_id.isascii() and doctor_id.isdigit() else None
+
+
+# Explicit patient ids must be plain integers so the patient_id sequence can be moved past them
+def record_patient_id(record):
+    patient_id = str(record.get('patient_id') or '').strip()
+    if not patient_id:
+        return None
+    return str(int(patient_id)) if patient_id.isascii() and patient_id.isdigit() else False
+
+
+# Score one chunk of import records in a single batch and insert it; returns the rejected records.
+# The caller commits, so prescriptions, ratings and the checkpoint land in one transaction.
+def import_prescription_chunk(records, allocator, doctors_by_name, doctors_by_id):
+    resolve_doctors(records, doctors_by_name, doctors_by_id)
+    given_ids = [str(r['id']) for r in records if r.get('id')]
+    existing = {row[0] for row in db.session.query(Prescription.id).filter(Prescription.id.in_(given_ids))}
+
+    accepted, rejected = [], []
+    for record in records:
+        diagnosis = str(record.get('diagnosis') or '').strip()
+        medications = bulk_io.parse_list(record.get('medications'))
+        doctor_id = record_doctor_id(record, doctors_by_name, doctors_by_id)
+        patient_id = record_patient_id(record)
+        entry = knowledge_base.lookup(diagnosis)
+        try:
+            created_at = bulk_io.parse_datetime(record.get('created_at')) or datetime.utcnow()
+        except ValueError:
+            created_at = None
+        reason = (
+            'missing diagnosis' if not diagnosis else
+            'unknown diagnosis' if entry is None else
+            'no medications' if not medications else
+            'unknown doctor' if doctor_id is None else
+            'bad created_at' if created_at is None else
+            'bad patient_id' if patient_id is False else
+            'duplicate id' if record.get('id') and str(record['id']) in existing else
+            None
+        )
+        if reason:
+            rejected.append(dict(record, error=reason))
+            continue
+        if record.get('id'):
+            existing.add(str(record['id']))
+        accepted.append((record, diagnosis, str(record.get('symptoms') or ''), medications, doctor_id, entry,
+                         created_at, patient_id))
+
+    # Keep the sequence from handing out ids this chunk imports, in this chunk and in other workers
+    last_patient_id = max((int(a[-1]) for a in accepted if a[-1]), default=0)
+    if last_patient_id:
+        allocator.advance(last_patient_id)
+    scored = scoring.score_batch(model, [(diagnosis, symptoms, medications)
+                                         for _, diagnosis, symptoms, medications, *_ in accepted],
+                                 confidence_matrix, medication_resolver)
+    prescriptions, medication_rows, totals = [], [], {}
+    for (record, diagnosis, symptoms, medications, doctor_id, entry, created_at, patient_id), confidence_dict in zip(
+            accepted, scored):
+        result = scoring.evaluate(medications, entry['recommended_meds'], confidence_dict, medication_resolver)
+        prescription_id = str(record.get('id') or uuid.uuid4())
+        prescriptions.append(prescription_values(
+            diagnosis, symptoms, medications, result, id=prescription_id,
+            patient_id=patient_id or str(allocator.next()), doctor_id=doctor_id,
+            drug_type=record.get('drug_type') or '', duration=record.get('duration') or '',
+            usage=record.get('usage') or '', info=record.get('info') or '', created_at=created_at,
+        ))
+        medication_rows.extend(dict(values, prescription_id=prescription_id)
+                               for values in medication_row_values(medications, result, medication_resolver))
+        total, count = totals.get(doctor_id, (0, 0))
+        totals[doctor_id] = (total + result["ai_score"], count + 1)
+
+    if prescriptions:
+        db.session.execute(db.insert(Prescription), prescriptions)
+        db.session.execute(db.insert(PrescriptionMedication), medication_rows)
+        update_doctor_ratings(totals)
+        if last_patient_id:
+            allocator.advance(last_patient_id, db.session)
+    return rejected
+
+
+@app.cli.command('import-prescriptions')
+@click.argument('path')
+@click.option('--format', 'fmt', type=click.Choice(bulk_io.FORMATS), default=None, help='Default: from extension')
+@click.option('--chunk-size', default=2000, show_default=True, help='Records scored and committed together')
+@click.option('--source', default=None, help='Checkpoint name (default: file name); rerun to resume')
+@click.option('--restart', is_flag=True, help='Ignore the checkpoint and start from the first record')
+@click.option('--rejects', default=None, help='Write rejected records with the reason to this JSONL file')
+def import_prescriptions(path, fmt, chunk_size, source, restart, rejects):
+    """Bulk-load historical prescriptions from CSV or JSONL.
+
+    Records need diagnosis, medications and doctor (username) or doctor_id;
+    id, patient_id (an integer), symptoms, drug_type, duration, usage, info
+    and created_at are optional. Each chunk is one transaction including the checkpoint, so
+    an interrupted import resumes after the last committed chunk.
+    """
+    source = source or os.path.basename(path)
+    checkpoint = db.session.get(ImportCheckpoint, source)
+    done = 0 if restart or checkpoint is None else checkpoint.rows_done
+    if done:
+        click.echo(f"Resuming {source} after {done} records")
+    # One counter round-trip per chunk instead of per prescription
+    allocator = SequenceAllocator(db, 'patient_id', block_size=chunk_size)
+    doctors_by_name, doctors_by_id = {}, {}
+    imported = rejected = 0
+    rejects_file = open(rejects, 'a', encoding='utf-8') if rejects else None
+    try:
+        for records in bulk_io.chunked(bulk_io.read_records(path, fmt, skip=done), chunk_size):
+            bad = import_prescription_chunk(records, allocator, doctors_by_name, doctors_by_id)
+            done += len(records)
+            db.session.merge(ImportCheckpoint(source=source, rows_done=done, updated_at=datetime.utcnow()))
+            db.session.commit()
+            imported += len(records) - len(bad)
+            rejected += len(bad)
+            if rejects_file:
+                for record in bad:
+                    rejects_file.write(json.dumps(record, ensure_ascii=False, default=str) + "\n")
+            db.session.expunge_all()
+            logger.info("Imported chunk", extra={"source": source, "records_done": done, "rejected": len(bad)})
+    finally:
+        if rejects_file:
+            rejects_file.close()
+    click.echo(f"Imported {imported} prescriptions from {source}, rejected {rejected} ({done} records processed)")
+
+
+# Prescription with its per-medication evaluation, for export
+def export_record(prescription):
+    return {
+        "id": prescription.id,
+        "patient_id": prescription.patient_id,
+        "doctor_id": prescription.doctor_id,
+        "doctor": prescription.doctor.username if prescription.doctor else None,
+        "diagnosis": prescription.diagnosis,
+        "symptoms": prescription.symptoms,
+        "medications": prescription.medication_list or bulk_io.parse_list(prescription.medications),
+        "drug_type": prescription.drug_type,
+        "duration": prescription.duration,
+        "usage": prescription.usage,
+        "info": prescription.info,
+        "ai_score": prescription.ai_score,
+        "correct_meds": prescription.correct_meds,
+        "incorrect_meds": prescription.incorrect_meds,
+        "essential_meds": prescription.essential_meds,
+        "non_essential_meds": prescription.non_essential_meds,
+        "confidence_scores": prescription.confidence_scores,
+        "created_at": prescription.created_at,
+        "evaluation": [
+            {"medication": row.medication, "confidence": row.confidence, "is_prescribed": row.is_prescribed,
+             "is_correct": row.is_correct, "is_essential": row.is_essential}
+            for row in prescription.medication_rows
+        ],
+    }
+
+
+@app.cli.command('export-prescriptions')
+@click.argument('path')
+@click.option('--format', 'fmt', type=click.Choice(bulk_io.FORMATS), default=None, help='Default: from extension')
+@click.option('--since', default=None, help='Only prescriptions created on or after YYYY-MM-DD')
+@click.option('--doctor-id', type=int, default=None)
+@click.option('--batch-size', default=1000, show_default=True)
+def export_prescriptions(path, fmt, since, doctor_id, batch_size):
+    """Stream prescriptions and their evaluations to CSV or JSONL ('-' for stdout), newest first."""
+    filters = {'doctor_id': doctor_id, 'medication': None, 'date_from': since, 'date_to': None}
+    query = filter_prescriptions(prescriptions_query(), filters)
+    cursor = None
+    with bulk_io.record_writer(path, fmt) as writer:
+        while True:
+            # Keyset pages keep memory flat; the session is cleared after each one
+            prescriptions, cursor = keyset_page(query, Prescription, cursor, batch_size)
+            for prescription in prescriptions:
+                writer.write(export_record(prescription))
+            db.session.expunge_all()
+            if cursor is None:
+                break
+    if path != '-':
+        click.echo(f"Exported {writer.count} prescriptions to {path}")
 
 
 @app.route('/admin/audit_logs')
 def view_audit_logs():
-    if 'user_id' not in session or session['role'] != 'admin':
+    if not has_role('admin'):
         flash('Access denied!', 'danger')
         return redirect(url_for('login'))
-    logs = AuditLog.query.order_by(AuditLog.created_at.desc()).all()
-    audit_log = AuditLog(
+    filters = listing_filters()
+    query = audit_logs_query()
+    if filters['user_id']:
+        query = query.filter(AuditLog.user_id == filters['user_id'])
+    if filters['action']:
+        query = query.filter(AuditLog.action == filters['action'])
+    query = filter_created_at(query, AuditLog, filters)
+    logs, next_cursor = keyset_page(query, AuditLog, request.args.get('cursor'),
+                                    per_page_arg(request.args.get('per_page')))
+    users = User.query.order_by(User.username).all()
+    actions = audit_actions()
+    audit_writer.log(
         user_id=session['user_id'],
         action="View Audit Logs",
-        details=f"Admin viewed audit logs, total: {len(logs)}"
+        details=f"Admin viewed audit logs page, shown: {len(logs)}"
     )
-    db.session.add(audit_log)
-    db.session.commit()
-    return render_template('audit_logs.html', logs=logs)
+    return render_template('audit_logs.html', logs=logs, users=users, actions=actions,
+                           filters=filters, next_cursor=next_cursor)
+
+
+@app.route('/admin/pharmacy_stats')
+def pharmacy_stats():
+    if not has_role('admin'):
+        return jsonify({'error': 'Access denied'}), 403
+    return jsonify({'cache': pharmacy.search_cache.stats(), 'client': pharmacy.client.stats(),
+                    'audit': audit_writer.stats(), 'qr': qr_artifacts.stats(),
+                    'login_limits': {'ip': login_ip_limiter.stats(), 'user': login_failure_limiter.stats()},
+                    'users': user_cache.stats()})
 
 
 @app.route('/patient/<prescription_id>')
 def patient_view(prescription_id):
-    prescription = Prescription.query.get_or_404(prescription_id)
-    medications = prescription.medications.split(',')
-    pharmacies = get_pharmacy_availability(medications)
-    audit_log = AuditLog(
+    prescription = prescriptions_query().filter_by(id=prescription_id).first_or_404()
+    medications = prescription.medication_list or prescription.medications.split(',')
+    with instrumentation.timed('http'):
+        pharmacies = get_pharmacy_availability(medications, medication_resolver)
+    audit_writer.log(
         user_id=None,
         action="Patient View Prescription",
         prescription_id=prescription_id,
         details=f"Patient viewed prescription {prescription_id} with {len(pharmacies)} pharmacies"
     )
-    db.session.add(audit_log)
-    db.session.commit()
     return render_template('patient_prescription.html', prescription=prescription, pharmacies=pharmacies)
 
 
@@ -0,0 +1,202 @@
+import atexit
+import logging
+import os
+import queue
+import threading
+import time
+from datetime import datetime
+
+from sqlalchemy import insert
+from sqlalchemy.exc import OperationalError
+
+logger = logging.getLogger(__name__)
+
+
+class AuditWriter:
+    """Queues audit events in memory and writes them in batches from a background thread.
+
+    mode='async' (default) batches inserts off the request path; mode='sync'
+    writes each event immediately through the request session, which keeps
+    tests deterministic. When the queue is full, ``overflow`` decides what
+    happens: 'block' waits up to ``put_timeout`` then writes inline, 'sync'
+    writes inline straight away, 'drop' discards the event and counts it.
+
+    A batch that hits an operational error (e.g. SQLite "database is locked")
+    is retried ``retries`` times with exponential backoff from
+    ``retry_backoff`` seconds; a batch rejected for its data is written one
+    event at a time, so only the bad events are dropped.
+    """
+
+    def __init__(self, app, db, model, mode='async', maxsize=10000, batch_size=500,
+                 flush_interval=1.0, overflow='block', put_timeout=0.5, retries=5, retry_backoff=0.5):
+        self.app = app
+        self.db = db
+        self.model = model
+        self.mode = mode
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.overflow = overflow
+        self.put_timeout = put_timeout
+        self.retries = retries
+        self.retry_backoff = retry_backoff
+        self._queue = queue.Queue(maxsize=maxsize)
+        self._thread = None
+        self._pid = None
+        self._start_lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._closed = False
+        self.written = 0
+        self.dropped = 0
+        self.inline_writes = 0
+        self.retried = 0
+        atexit.register(self.close)
+
+    # Record an audit event; kwargs are AuditLog columns
+    def log(self, **event):
+        event.setdefault('created_at', datetime.utcnow())
+        if self.mode == 'sync' or self._closed:
+            self._write_inline(event)
+            return
+        self._ensure_thread()
+        try:
+            if self.overflow == 'block':
+                self._queue.put(event, timeout=self.put_timeout)
+            else:
+                self._queue.put_nowait(event)
+        except queue.Full:
+            if self.overflow == 'drop':
+                self.dropped += 1
+                logger.warning("Audit queue full, dropped event", extra={"action": event['action']})
+            else:
+                self._write_inline(event)
+
+    def _write_inline(self, event):
+        self.inline_writes += 1
+        self.db.session.add(self.model(**event))
+        self.db.session.commit()
+
+    # (Re)start the writer thread, e.g. in a worker forked after import
+    def _ensure_thread(self):
+        if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+            return
+        with self._start_lock:
+            if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+                return
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name='audit-writer', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            try:
+                first = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                continue
+            taken = 1
+            stop = first is None
+            batch = [] if stop else [first]
+            while not stop and len(batch) < self.batch_size:
+                try:
+                    event = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                taken += 1
+                if event is None:
+                    stop = True
+                else:
+                    batch.append(event)
+            if batch:
+                self._write_batch(batch)
+            for _ in range(taken):
+                self._queue.task_done()
+            if stop:
+                self._drain()
+                return
+
+    # Write whatever is still queued, in batches
+    def _drain(self):
+        while True:
+            batch = []
+            taken = 0
+            while len(batch) < self.batch_size:
+                try:
+                    event = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                taken += 1
+                if event is not None:
+                    batch.append(event)
+            if batch:
+                self._write_batch(batch)
+            for _ in range(taken):
+                self._queue.task_done()
+            if not taken:
+                return
+
+    # One multi-row INSERT per batch, retried while the database is busy
+    def _write_batch(self, batch):
+        for attempt in range(self.retries + 1):
+            if attempt:
+                self.retried += 1
+                time.sleep(self.retry_backoff * 2 ** (attempt - 1))
+            error = self._insert(batch)
+            if error is None:
+                self.written += len(batch)
+                return
+            if not isinstance(error, OperationalError):
+                break
+        if isinstance(error, OperationalError):
+            lost = len(batch)
+        else:
+            # Rejected for its data: write the events one by one so only the bad ones are lost
+            lost = 0
+            for event in batch:
+                if self._insert([event]) is None:
+                    self.written += 1
+                else:
+                    lost += 1
+        if lost:
+            self.dropped += lost
+            logger.error("Audit events lost", extra={"events": lost, "batch": len(batch), "error": str(error)})
+
+    # Returns None on success, else the exception
+    def _insert(self, events):
+        with self._write_lock, self.app.app_context():
+            try:
+                self.db.session.execute(insert(self.model), events)
+                self.db.session.commit()
+                return None
+            except Exception as e:
+                self.db.session.rollback()
+                logger.warning("Audit insert failed", extra={"events": len(events), "error": str(e)})
+                return e
+            finally:
+                self.db.session.remove()
+
+    # Block until everything queued so far is written
+    def flush(self):
+        if self._thread is None or not self._thread.is_alive() or self._pid != os.getpid():
+            self._drain()
+            return
+        self._queue.join()
+
+    # Stop the writer and write everything still queued; registered with atexit
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+            self._queue.put(None)
+            self._thread.join()
+        else:
+            self._drain()
+
+    def stats(self):
+        return {
+            "mode": self.mode,
+            "queued": self._queue.qsize(),
+            "written": self.written,
+            "dropped": self.dropped,
+            "inline_writes": self.inline_writes,
+            "retried": self.retried,
+        }
@@ -0,0 +1,208 @@
+"""Password hashing off the request thread, plus login rate limiting.
+
+bcrypt runs in a bounded worker pool (AUTH_WORKERS processes, or threads with
+AUTH_POOL=thread) so a burst of logins queues there instead of pinning every
+request thread. At most AUTH_MAX_PENDING hashes may be queued or running; past
+that callers get ``HasherBusy`` at once rather than waiting. A pool broken by a
+dead worker process is replaced on the next call. The cost factor comes from
+BCRYPT_ROUNDS; hashes made with a different cost are upgraded on the next
+successful login (``needs_rehash``).
+
+``RateLimiter`` counts attempts in a sliding window per key (client IP,
+username) and is checked before any hashing happens. Limits are kept per
+worker process.
+"""
+import multiprocessing
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import bcrypt
+
+BCRYPT_ROUNDS = int(os.environ.get('BCRYPT_ROUNDS', 12))
+# Longest a request waits for a hash before giving up
+HASH_TIMEOUT = float(os.environ.get('AUTH_HASH_TIMEOUT', 10))
+
+
+class HasherBusy(TimeoutError):
+    """Too many hashes already pending; raised without queueing."""
+
+
+def _as_bytes(value):
+    return value.encode('utf-8') if isinstance(value, str) else bytes(value)
+
+
+def _hash(password, rounds):
+    return bcrypt.hashpw(password, bcrypt.gensalt(rounds))
+
+
+def _verify(password, hashed):
+    return bcrypt.checkpw(password, hashed)
+
+
+# Cost factor of a "$2b$12$..." hash, or None if it isn't one
+def hash_rounds(hashed):
+    try:
+        return int(_as_bytes(hashed).split(b'$')[2])
+    except (IndexError, ValueError):
+        return None
+
+
+class PasswordHasher:
+    """bcrypt in a bounded pool; ``workers=0`` hashes inline."""
+
+    def __init__(self, rounds=BCRYPT_ROUNDS, workers=None, kind='process', timeout=HASH_TIMEOUT, max_pending=None):
+        self.rounds = rounds
+        self.workers = (os.cpu_count() or 1) if workers is None else workers
+        self.kind = kind
+        self.timeout = timeout
+        self.max_pending = self.workers * 8 if max_pending is None else max_pending
+        self._slots = threading.BoundedSemaphore(max(1, self.max_pending))
+        self._executor = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    # Created on first use and again after a fork, so every worker process gets its own pool
+    def _pool(self):
+        with self._lock:
+            if self._executor is None or self._pid != os.getpid():
+                if self.kind == 'thread':
+                    self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='bcrypt')
+                else:
+                    # Not fork: forking a process with request threads running can copy locks held
+                    # mid-operation into the child. The fork server only preloads this module.
+                    if 'forkserver' in multiprocessing.get_all_start_methods():
+                        context = multiprocessing.get_context('forkserver')
+                        context.set_forkserver_preload([__name__])
+                    else:
+                        context = multiprocessing.get_context('spawn')
+                    self._executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=context)
+                self._pid = os.getpid()
+            return self._executor
+
+    def _run(self, func, *args):
+        if not self.workers:
+            return func(*args)
+        if not self._slots.acquire(blocking=False):
+            raise HasherBusy(f"{self.max_pending} password hashes already pending")
+        executor = self._pool()
+        try:
+            future = executor.submit(func, *args)
+        except BaseException as e:
+            self._slots.release()
+            if isinstance(e, BrokenProcessPool):
+                self._discard(executor)
+                raise HasherBusy("password hashing pool restarting") from e
+            raise
+        # The slot is freed when the job finishes or is cancelled, not when the caller gives up
+        future.add_done_callback(lambda _: self._slots.release())
+        try:
+            return future.result(timeout=self.timeout)
+        except TimeoutError:
+            # Drop it if it hasn't started; a running hash can't be interrupted
+            future.cancel()
+            raise
+        except BrokenProcessPool as e:
+            # A worker died (e.g. OOM-killed); the next call starts a fresh pool
+            self._discard(executor)
+            raise HasherBusy("password hashing pool restarting") from e
+
+    def _discard(self, executor):
+        with self._lock:
+            if self._executor is executor:
+                self._executor = None
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    def hash(self, password):
+        return self._run(_hash, _as_bytes(password), self.rounds)
+
+    def verify(self, password, hashed):
+        try:
+            return self._run(_verify, _as_bytes(password), _as_bytes(hashed))
+        except ValueError:
+            # Stored value isn't a bcrypt hash
+            return False
+
+    def needs_rehash(self, hashed):
+        return hash_rounds(hashed) != self.rounds
+
+    def close(self):
+        with self._lock:
+            if self._executor is not None and self._pid == os.getpid():
+                self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+class RateLimiter:
+    """At most ``limit`` hits per key in any ``window`` seconds."""
+
+    def __init__(self, limit, window=60.0, max_keys=100000):
+        self.limit = limit
+        self.window = window
+        self.max_keys = max_keys
+        self._hits = {}
+        self._lock = threading.Lock()
+        self.rejected = 0
+
+    def _recent(self, key, now):
+        hits = self._hits.get(key)
+        if hits is None:
+            return None
+        while hits and hits[0] <= now - self.window:
+            hits.popleft()
+        if not hits:
+            del self._hits[key]
+            return None
+        return hits
+
+    def allowed(self, key):
+        if self.limit <= 0:
+            return True
+        with self._lock:
+            hits = self._recent(key, time.monotonic())
+            if hits is not None and len(hits) >= self.limit:
+                self.rejected += 1
+                return False
+            return True
+
+    def add(self, key):
+        if self.limit <= 0:
+            return
+        now = time.monotonic()
+        with self._lock:
+            hits = self._recent(key, now)
+            if hits is None:
+                if len(self._hits) >= self.max_keys:
+                    self._prune(now)
+                hits = self._hits[key] = deque()
+            hits.append(now)
+
+    # Check and count in one step
+    def hit(self, key):
+        if not self.allowed(key):
+            return False
+        self.add(key)
+        return True
+
+    def reset(self, key):
+        with self._lock:
+            self._hits.pop(key, None)
+
+    def _prune(self, now):
+        for key in list(self._hits):
+            self._recent(key, now)
+
+    # Seconds until `key` may try again
+    def retry_after(self, key):
+        with self._lock:
+            hits = self._recent(key, time.monotonic())
+            if hits is None or len(hits) < self.limit:
+                return 0
+            return max(0, int(hits[0] + self.window - time.monotonic()) + 1)
+
+    def stats(self):
+        with self._lock:
+            return {"keys": len(self._hits), "rejected": self.rejected, "limit": self.limit, "window": self.window}
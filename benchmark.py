@@ -0,0 +1,324 @@
+"""Load-test harness for the Flask app's hot routes.
+
+Seeds a scratch SQLite database, starts the pharmacy stub
+(pharmacy_stub.py) and the app on local ports, then drives each route at a
+fixed concurrency and prints latency percentiles, throughput and SQL queries
+per request as JSON:
+
+    python benchmark.py --doctors 20 --prescriptions 5000 --audit-rows 20000 \\
+        --concurrency 8 --requests 400 --pharmacy-latency 0.05 --output bench.json
+    python benchmark.py --compare bench.json      # run again and diff against a saved report
+
+Environment variables the app reads (AUDIT_MODE, PHARMACY_CACHE_TTL, ...)
+apply as usual.
+"""
+import argparse
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+import numpy as np
+import requests
+
+ROUTES = ['login', 'create_prescription', 'patient_view', 'admin_dashboard', 'generate_qr']
+PASSWORD = 'bench'
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def _git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], stderr=subprocess.DEVNULL,
+                                       cwd=os.path.dirname(os.path.abspath(__file__))).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+# N doctors + 1 admin, M prescriptions spread over doctors and catalog diagnoses, K audit rows
+def seed(app_module, doctors, prescriptions, audit_rows, bcrypt_rounds, seed_value=0):
+    import bcrypt
+    import scoring
+
+    rng = random.Random(seed_value)
+    db, User, Prescription, AuditLog = app_module.db, app_module.User, app_module.Prescription, app_module.AuditLog
+    password = bcrypt.hashpw(PASSWORD.encode('utf-8'), bcrypt.gensalt(bcrypt_rounds))
+    entries = [app_module.knowledge_base.lookup(name) for name in app_module.knowledge_base.diagnoses()]
+    now = datetime.utcnow()
+
+    db.session.add_all(User(username=f'doctor{i}', password=password, role='doctor') for i in range(doctors))
+    db.session.add(User(username='admin', password=password, role='admin'))
+    db.session.commit()
+    doctor_ids = [u.id for u in User.query.filter_by(role='doctor').order_by(User.id)]
+
+    ids = []
+    for start in range(0, prescriptions, 1000):
+        batch = []
+        for i in range(start, min(start + 1000, prescriptions)):
+            entry = rng.choice(entries)
+            meds = entry['recommended_meds'][:]
+            result = scoring.evaluate(meds, entry['recommended_meds'], {m: 0.8 for m in meds})
+            prescription_id = str(uuid.uuid4())
+            ids.append(prescription_id)
+            batch.append(Prescription(
+                id=prescription_id, patient_id=str(app_module.patient_ids.next()),
+                doctor_id=doctor_ids[i % len(doctor_ids)], diagnosis=entry['name'],
+                symptoms=', '.join(entry['symptoms']), medications=','.join(meds), ai_score=result['ai_score'],
+                correct_meds=','.join(result['correct_meds']), incorrect_meds='',
+                essential_meds=','.join(result['essential_meds']), non_essential_meds='',
+                confidence_scores=','.join(f"{m}:0.80" for m in meds), created_at=now - timedelta(minutes=i),
+                medication_rows=app_module.build_medication_rows(meds, result),
+            ))
+        db.session.add_all(batch)
+        db.session.commit()
+
+    for start in range(0, audit_rows, 5000):
+        db.session.execute(db.insert(AuditLog), [
+            {"user_id": doctor_ids[i % len(doctor_ids)], "action": "Seed", "details": str(i),
+             "created_at": now - timedelta(seconds=i)}
+            for i in range(start, min(start + 5000, audit_rows))
+        ])
+    db.session.commit()
+    return [f'doctor{i}' for i in range(doctors)], ids, entries
+
+
+class StatementCounter:
+    """Counts SQL statements issued while serving requests (not background threads)."""
+
+    def __init__(self, app, engine):
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self.count = 0
+        app.before_request(self._start)
+        app.teardown_request(self._stop)
+        from sqlalchemy import event
+        event.listen(engine, 'before_cursor_execute', self._on_execute)
+
+    def _start(self):
+        self._local.active = True
+
+    def _stop(self, exc=None):
+        self._local.active = False
+
+    def _on_execute(self, *args):
+        if getattr(self._local, 'active', False):
+            with self._lock:
+                self.count += 1
+
+    def reset(self):
+        with self._lock:
+            count, self.count = self.count, 0
+        return count
+
+
+def _login(base_url, username):
+    session = requests.Session()
+    response = session.post(f"{base_url}/login", data={'username': username, 'password': PASSWORD},
+                            allow_redirects=False)
+    if response.status_code != 302:
+        raise RuntimeError(f"Login as {username} failed: {response.status_code}")
+    return session
+
+
+# One callable per route; each takes (session, rng) and returns the response
+def route_actions(base_url, doctors, prescription_ids, entries):
+    def login(session, rng):
+        return requests.post(f"{base_url}/login", data={'username': rng.choice(doctors), 'password': PASSWORD},
+                             allow_redirects=False)
+
+    def create_prescription(session, rng):
+        entry = rng.choice(entries)
+        return session.post(f"{base_url}/create_prescription", allow_redirects=False, data={
+            'diagnosis': entry['name'], 'symptoms': ', '.join(entry['symptoms']),
+            'medications': ', '.join(entry['recommended_meds']),
+        })
+
+    def patient_view(session, rng):
+        return session.get(f"{base_url}/patient/{rng.choice(prescription_ids)}")
+
+    def admin_dashboard(session, rng):
+        return session.get(f"{base_url}/admin")
+
+    def generate_qr(session, rng):
+        return session.get(f"{base_url}/prescription/{rng.choice(prescription_ids)}/qr")
+
+    return {'login': login, 'create_prescription': create_prescription, 'patient_view': patient_view,
+            'admin_dashboard': admin_dashboard, 'generate_qr': generate_qr}
+
+
+# Run `total` requests of one route with `concurrency` workers, each with its own session
+def run_route(action, sessions, total, seed_value):
+    latencies = []
+    errors = 0
+    lock = threading.Lock()
+    counter = iter(range(total))
+
+    def worker(index):
+        nonlocal errors
+        rng = random.Random(seed_value + index)
+        session = sessions[index]
+        while True:
+            with lock:
+                if next(counter, None) is None:
+                    return
+            started = time.perf_counter()
+            try:
+                response = action(session, rng)
+                ok = response.status_code < 400
+            except requests.RequestException:
+                ok = False
+            elapsed = time.perf_counter() - started
+            with lock:
+                latencies.append(elapsed)
+                if not ok:
+                    errors += 1
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=len(sessions)) as pool:
+        list(pool.map(worker, range(len(sessions))))
+    wall = time.perf_counter() - started
+    return latencies, errors, wall
+
+
+def summarize(latencies, errors, wall, queries, concurrency):
+    ms = np.asarray(latencies) * 1000.0
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "concurrency": concurrency,
+        "throughput_rps": round(len(latencies) / wall, 2) if wall else None,
+        "latency_ms": {
+            "p50": round(float(np.percentile(ms, 50)), 2),
+            "p95": round(float(np.percentile(ms, 95)), 2),
+            "p99": round(float(np.percentile(ms, 99)), 2),
+            "mean": round(float(ms.mean()), 2),
+            "max": round(float(ms.max()), 2),
+        } if len(ms) else {},
+        "queries_per_request": round(queries / len(latencies), 2) if latencies else None,
+    }
+
+
+# Percentage change of p95 latency, throughput and queries per request against a saved report
+def compare(baseline, report):
+    rows = {}
+    for route, current in report["routes"].items():
+        before = baseline.get("routes", {}).get(route)
+        if not before:
+            continue
+
+        def change(old, new):
+            return round((new - old) / old * 100.0, 1) if old and new is not None else None
+
+        rows[route] = {
+            "p95_change_pct": change(before["latency_ms"].get("p95"), current["latency_ms"].get("p95")),
+            "throughput_change_pct": change(before["throughput_rps"], current["throughput_rps"]),
+            "queries_change_pct": change(before["queries_per_request"], current["queries_per_request"]),
+        }
+    return {"baseline_commit": baseline.get("commit"), "routes": rows}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--doctors', type=int, default=10)
+    parser.add_argument('--prescriptions', type=int, default=1000)
+    parser.add_argument('--audit-rows', type=int, default=5000)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--requests', type=int, default=200, help='requests per route')
+    parser.add_argument('--routes', default=','.join(ROUTES), help='comma-separated subset of ' + ','.join(ROUTES))
+    parser.add_argument('--pharmacy-latency', type=float, default=0.05, help='stub latency in seconds')
+    parser.add_argument('--pharmacy-failure-rate', type=float, default=0.0)
+    parser.add_argument('--bcrypt-rounds', type=int, default=12, help='cost of the seeded password hashes')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='write the JSON report here as well as stdout')
+    parser.add_argument('--compare', help='baseline report to diff against')
+    args = parser.parse_args(argv)
+
+    routes = [r.strip() for r in args.routes.split(',') if r.strip()]
+    unknown = set(routes) - set(ROUTES)
+    if unknown:
+        parser.error(f"unknown routes: {', '.join(sorted(unknown))}")
+
+    # Everything the app reads at import time must be in place before importing it
+    workdir = tempfile.mkdtemp(prefix='eprescription-bench-')
+    stub_port = _free_port()
+    os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(workdir, 'bench.db')
+    os.environ['QR_CACHE_DIR'] = os.path.join(workdir, 'qr')
+    os.environ['PHARMACY_API_URL'] = f"http://127.0.0.1:{stub_port}/api/web/Product/Search"
+    # Every simulated client shares 127.0.0.1; measure login cost, not the per-IP limiter
+    os.environ.setdefault('LOGIN_LIMIT_PER_IP', '0')
+
+    from pharmacy_stub import start_stub_server
+    stub, _ = start_stub_server(stub_port, args.pharmacy_latency, args.pharmacy_failure_rate, args.seed)
+
+    from werkzeug.serving import WSGIRequestHandler, make_server
+    import app as app_module
+
+    class QuietHandler(WSGIRequestHandler):
+        def log_request(self, *args, **kwargs):
+            pass
+
+    app, db = app_module.app, app_module.db
+    with app.app_context():
+        doctors, prescription_ids, entries = seed(app_module, args.doctors, args.prescriptions, args.audit_rows,
+                                                  args.bcrypt_rounds, args.seed)
+        counter = StatementCounter(app, db.engine)
+    app_module.audit_writer.flush()
+
+    server = make_server('127.0.0.1', 0, app, threaded=True, request_handler=QuietHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_port}"
+
+    actions = route_actions(base_url, doctors, prescription_ids, entries)
+    results = {}
+    for route in routes:
+        user = 'admin' if route == 'admin_dashboard' else None
+        sessions = [_login(base_url, user or doctors[i % len(doctors)]) for i in range(args.concurrency)]
+        app_module.audit_writer.flush()
+        counter.reset()
+        latencies, errors, wall = run_route(actions[route], sessions, args.requests, args.seed)
+        queries = counter.reset()
+        results[route] = summarize(latencies, errors, wall, queries, args.concurrency)
+        print(f"{route}: p95 {results[route]['latency_ms'].get('p95')} ms, "
+              f"{results[route]['throughput_rps']} req/s", file=sys.stderr)
+
+    server.shutdown()
+    stub.shutdown()
+    app_module.audit_writer.close()
+
+    report = {
+        "commit": _git_commit(),
+        "timestamp": datetime.utcnow().isoformat(timespec='seconds') + 'Z',
+        "config": {
+            "doctors": args.doctors, "prescriptions": args.prescriptions, "audit_rows": args.audit_rows,
+            "concurrency": args.concurrency, "requests": args.requests,
+            "pharmacy_latency": args.pharmacy_latency, "pharmacy_failure_rate": args.pharmacy_failure_rate,
+            "bcrypt_rounds": args.bcrypt_rounds, "seed": args.seed,
+        },
+        "routes": results,
+        "pharmacy_stub_requests": stub.request_count,
+    }
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            report["comparison"] = compare(json.load(f), report)
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text + "\n")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,126 @@
+"""Streaming CSV / JSONL records for bulk prescription import and export.
+
+Records are read and written one at a time, so files of any size run in
+constant memory. ``-`` means stdin/stdout. The import/export loops live in
+app.py (``flask import-prescriptions`` / ``flask export-prescriptions``).
+"""
+import csv
+import json
+import os
+import sys
+from contextlib import contextmanager
+from datetime import datetime
+from itertools import islice
+
+FORMATS = ('csv', 'jsonl')
+
+# Column order for CSV exports; lists are comma-joined, nested values JSON-encoded
+EXPORT_FIELDS = [
+    'id', 'patient_id', 'doctor_id', 'doctor', 'diagnosis', 'symptoms', 'medications', 'drug_type', 'duration',
+    'usage', 'info', 'ai_score', 'correct_meds', 'incorrect_meds', 'essential_meds', 'non_essential_meds',
+    'confidence_scores', 'created_at', 'evaluation',
+]
+
+
+def detect_format(path, fmt=None):
+    if fmt:
+        return fmt
+    if path.lower().endswith(('.jsonl', '.ndjson', '.json')):
+        return 'jsonl'
+    return 'csv'
+
+
+@contextmanager
+def open_text(path, mode):
+    if path == '-':
+        yield sys.stdin if 'r' in mode else sys.stdout
+        return
+    with open(path, mode, encoding='utf-8', newline='') as f:
+        yield f
+
+
+# Yield records as dicts, skipping the first `skip` (already imported) records
+def read_records(path, fmt=None, skip=0):
+    fmt = detect_format(path, fmt)
+    with open_text(path, 'r') as f:
+        if fmt == 'csv':
+            records = csv.DictReader(f)
+        else:
+            records = (json.loads(line) for line in f if line.strip())
+        yield from islice(records, skip, None)
+
+
+def chunked(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+# A list, or a comma-joined string, as a clean list of names
+def parse_list(value):
+    if value is None:
+        return []
+    if isinstance(value, (list, tuple)):
+        items = value
+    else:
+        items = str(value).split(',')
+    return [str(item).strip() for item in items if str(item).strip()]
+
+
+# ISO-8601 ('2024-03-01T10:00:00', '2024-03-01 10:00:00') or a bare date; None if empty
+def parse_datetime(value):
+    if value is None or str(value).strip() == '':
+        return None
+    text = str(value).strip()
+    if text.endswith('Z'):
+        text = text[:-1]
+    return datetime.fromisoformat(text)
+
+
+def _csv_value(value):
+    if value is None:
+        return ''
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, (list, tuple)) and all(isinstance(item, str) for item in value):
+        return ','.join(value)
+    if isinstance(value, (list, tuple, dict)):
+        return json.dumps(value, ensure_ascii=False)
+    return value
+
+
+def _json_value(value):
+    return value.isoformat() if isinstance(value, datetime) else str(value)
+
+
+class RecordWriter:
+    """Writes dict records to CSV (with EXPORT_FIELDS header) or JSONL."""
+
+    def __init__(self, stream, fmt, fields=EXPORT_FIELDS):
+        self.stream = stream
+        self.fmt = fmt
+        self.count = 0
+        self._csv = None
+        if fmt == 'csv':
+            self._csv = csv.DictWriter(stream, fieldnames=fields, extrasaction='ignore')
+            self._csv.writeheader()
+
+    def write(self, record):
+        if self._csv is not None:
+            self._csv.writerow({key: _csv_value(value) for key, value in record.items()})
+        else:
+            self.stream.write(json.dumps(record, ensure_ascii=False, default=_json_value) + "\n")
+        self.count += 1
+
+
+@contextmanager
+def record_writer(path, fmt=None):
+    fmt = detect_format(path, fmt)
+    if path != '-':
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+    with open_text(path, 'w') as f:
+        yield RecordWriter(f, fmt)
@@ -0,0 +1,150 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class _Load:
+    """A load in progress, shared by concurrent misses for one key."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.ok = False
+
+
+class TTLCache:
+    """Thread-safe LRU cache with per-entry TTL, negative caching and stale-while-revalidate.
+
+    An entry is fresh for ``ttl`` seconds (``negative_ttl`` for failures). After
+    that it is still served for up to ``stale_ttl`` seconds while one background
+    refresh reloads it; past that window it is a plain miss. Concurrent misses
+    for the same key share one load.
+    """
+
+    def __init__(self, maxsize=512, ttl=300, negative_ttl=30, stale_ttl=600, executor=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.stale_ttl = stale_ttl
+        self.executor = executor
+        self._data = OrderedDict()
+        self._refreshing = set()
+        self._loading = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.refreshes = 0
+        self.negative_entries = 0
+        self.coalesced = 0
+
+    # Store a value; negative entries expire after negative_ttl
+    def set(self, key, value, negative=False):
+        ttl = self.negative_ttl if negative else self.ttl
+        expires_at = time.monotonic() + ttl
+        with self._lock:
+            self._data[key] = (value, expires_at, expires_at + self.stale_ttl)
+            self._data.move_to_end(key)
+            if negative:
+                self.negative_entries += 1
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    # Return (found, value, is_stale) without loading anything
+    def get(self, key):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return False, None, False
+            value, expires_at, stale_until = entry
+            if now >= stale_until:
+                del self._data[key]
+                return False, None, False
+            self._data.move_to_end(key)
+            return True, value, now >= expires_at
+
+    # Fresh hit -> cached value; stale hit -> cached value + background refresh;
+    # miss -> loader() synchronously, or the result of a load already in flight for
+    # the key (waiting at most `timeout` seconds before loading itself).
+    # is_negative(value) marks failures.
+    def get_or_load(self, key, loader, is_negative=None, background_loader=None, timeout=None):
+        found, value, stale = self.get(key)
+        if found:
+            with self._lock:
+                if stale:
+                    self.stale_hits += 1
+                else:
+                    self.hits += 1
+            if stale:
+                self._refresh(key, background_loader or loader, is_negative)
+            return value
+
+        with self._lock:
+            self.misses += 1
+            load = self._loading.get(key)
+            leader = load is None
+            if leader:
+                load = self._loading[key] = _Load()
+            else:
+                self.coalesced += 1
+        if not leader:
+            if load.done.wait(timeout) and load.ok:
+                return load.value
+            return loader()
+
+        try:
+            value = loader()
+            self.set(key, value, negative=bool(is_negative and is_negative(value)))
+            load.value, load.ok = value, True
+            return value
+        finally:
+            with self._lock:
+                self._loading.pop(key, None)
+            load.done.set()
+
+    def _refresh(self, key, loader, is_negative):
+        with self._lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+            self.refreshes += 1
+
+        def run():
+            try:
+                value = loader()
+                self.set(key, value, negative=bool(is_negative and is_negative(value)))
+            finally:
+                with self._lock:
+                    self._refreshing.discard(key)
+
+        if self.executor is not None:
+            self.executor.submit(run)
+        else:
+            threading.Thread(target=run, daemon=True).start()
+
+    def invalidate(self, key=None):
+        with self._lock:
+            if key is None:
+                self._data.clear()
+            else:
+                self._data.pop(key, None)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "stale_hits": self.stale_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "refreshes": self.refreshes,
+                "negative_entries": self.negative_entries,
+                "coalesced": self.coalesced,
+            }
+
+    def __len__(self):
+        return len(self._data)
@@ -0,0 +1,112 @@
+"""Precomputed confidence for every catalog diagnosis x known medication.
+
+The model only sees "<diagnosis> <symptoms> <medication>" through its
+TF-IDF bag of words, so two inputs with the same tokens get the same score.
+Rows of the matrix are keyed by the token signature of "diagnosis symptoms"
+for each catalog diagnosis (with its catalog symptoms, and with none);
+columns are medications. Anything not in the matrix is scored live.
+
+    python confidence_matrix.py build
+
+The file records the model version it was built from and is ignored once
+the model changes.
+"""
+import argparse
+import logging
+import re
+import sys
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TOKEN_PATTERN = r"(?u)\b\w\w+\b"
+MATRIX_PATH = 'confidence_matrix.npz'
+
+
+class ConfidenceMatrix:
+    def __init__(self, contexts, medications, matrix, version, token_pattern=DEFAULT_TOKEN_PATTERN):
+        self.contexts = {context: i for i, context in enumerate(contexts)}
+        self.medications = {med: j for j, med in enumerate(medications)}
+        self.matrix = matrix
+        self.version = version
+        self.token_pattern = token_pattern
+        self._token_re = re.compile(token_pattern)
+
+    # Order-independent token signature, matching what the vectorizer sees
+    def signature(self, text):
+        return " ".join(sorted(self._token_re.findall(text.lower())))
+
+    # Returns the precomputed probability, or None if the pair must be scored live
+    def lookup(self, diagnosis, symptoms, medication):
+        row = self.contexts.get(self.signature(f"{diagnosis} {symptoms}"))
+        column = self.medications.get(medication)
+        if row is None or column is None:
+            return None
+        return float(self.matrix[row, column])
+
+    def save(self, path=MATRIX_PATH):
+        contexts = sorted(self.contexts, key=self.contexts.get)
+        medications = sorted(self.medications, key=self.medications.get)
+        np.savez(path, contexts=np.array(contexts, dtype=str), medications=np.array(medications, dtype=str),
+                 matrix=self.matrix, version=np.array(self.version or ''),
+                 token_pattern=np.array(self.token_pattern))
+
+    # Load the matrix if it exists and was built for expected_version
+    @classmethod
+    def load(cls, path=MATRIX_PATH, expected_version=None):
+        try:
+            data = np.load(path)
+        except OSError:
+            return None
+        version = str(data['version'])
+        if expected_version is not None and version != expected_version:
+            logger.warning("Confidence matrix is stale, ignoring",
+                           extra={"matrix": path, "built_for": version, "model_version": expected_version})
+            return None
+        return cls(data['contexts'].tolist(), data['medications'].tolist(), data['matrix'], version,
+                   str(data['token_pattern']))
+
+
+# Score every catalog context against every medication in one predict_proba call
+def build_matrix(model, df, version, token_pattern=DEFAULT_TOKEN_PATTERN):
+    meds = sorted(set(df['Tavsiya etilgan dorilar'].str.split(',').explode().str.strip().dropna()) - {''})
+    pairs = list(dict.fromkeys(
+        [(name, symptoms) for name, symptoms in zip(df['Kasallik nomi'], df['Belgilar'].fillna(''))]
+        + [(name, '') for name in df['Kasallik nomi']]
+    ))
+    empty = ConfidenceMatrix([], [], None, version, token_pattern)
+    contexts = {}
+    for name, symptoms in pairs:
+        contexts.setdefault(empty.signature(f"{name} {symptoms}"), f"{name} {symptoms}")
+
+    rows = [f"{text} {med}" for text in contexts.values() for med in meds]
+    probabilities = np.asarray(model.predict_proba(rows))[:, 1] if rows else np.empty(0)
+    matrix = probabilities.reshape(len(contexts), len(meds))
+    return ConfidenceMatrix(list(contexts), meds, matrix, version, token_pattern)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Precompute the diagnosis x medication confidence matrix")
+    parser.add_argument('command', choices=['build'])
+    parser.add_argument('--csv', default='diseases.csv')
+    parser.add_argument('--model', default='medication_model.pkl')
+    parser.add_argument('--artifact', default='medication_model')
+    parser.add_argument('--output', default=MATRIX_PATH)
+    args = parser.parse_args(argv)
+
+    from model_artifact import model_version
+    from model_server import load_model
+    model = load_model(args.model, args.artifact)
+    token_pattern = getattr(getattr(model, 'named_steps', {}).get('tfidf'), 'token_pattern', None) \
+        or getattr(model, 'meta', {}).get('token_pattern', DEFAULT_TOKEN_PATTERN)
+    df = pd.read_csv(args.csv, encoding='utf-8')
+    matrix = build_matrix(model, df, model_version(args.model), token_pattern)
+    matrix.save(args.output)
+    print(f"Wrote {matrix.matrix.shape[0]} contexts x {matrix.matrix.shape[1]} medications to {args.output}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,6 +1,8 @@
 import os
+from database import database_url, engine_options
 
 class Config:
-    SQLALCHEMY_DATABASE_URI = 'sqlite:///e_prescription.db'  # SQLite URL
+    SQLALCHEMY_DATABASE_URI = database_url('sqlite:///e_prescription.db')  # SQLite URL, or DATABASE_URL
+    SQLALCHEMY_ENGINE_OPTIONS = engine_options(SQLALCHEMY_DATABASE_URI)
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     SECRET_KEY = os.urandom(24)
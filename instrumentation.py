@@ -0,0 +1,263 @@
+"""Request instrumentation, metrics and logging setup.
+
+``init_app`` records, for every request: wall time, SQL statement count and
+time (SQLAlchemy cursor events), and any time spent inside ``timed('model')``
+or ``timed('http')`` blocks. Totals are exported per route at /metrics in the
+Prometheus text format. Each worker process keeps its own counters.
+
+A sampling profiler can be turned on with PROFILE_SAMPLE_RATE (e.g. 0.01 for
+1% of requests); sampled requests are run under cProfile and the stats are
+written to PROFILE_DIR for ``python -m pstats`` / snakeviz.
+
+``configure_logging`` sets up leveled logging for the app (LOG_LEVEL) as one
+JSON object per line, or plain text with LOG_FORMAT=text.
+"""
+import cProfile
+import json
+import logging
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+from flask import Response, abort, g, has_request_context, request
+from sqlalchemy import event
+
+logger = logging.getLogger(__name__)
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# LogRecord attributes that aren't user-supplied `extra` fields
+_RECORD_FIELDS = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+
+class JSONFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_FIELDS:
+                entry[key] = value
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+# Install one stderr handler on the root logger unless the host (gunicorn, tests) already did
+def configure_logging(level=None, fmt=None):
+    level = (level or os.environ.get('LOG_LEVEL', 'INFO')).upper()
+    fmt = fmt or os.environ.get('LOG_FORMAT', 'json')
+    root = logging.getLogger()
+    root.setLevel(level)
+    if root.handlers:
+        return
+    handler = logging.StreamHandler()
+    if fmt == 'json':
+        handler.setFormatter(JSONFormatter())
+    else:
+        handler.setFormatter(logging.Formatter('%(asctime)s %(levelname)s %(name)s: %(message)s'))
+    root.addHandler(handler)
+
+
+class Metrics:
+    """Thread-safe counters and histograms rendered in Prometheus text format."""
+
+    def __init__(self, buckets=DURATION_BUCKETS):
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._histograms = {}
+        self._help = {}
+
+    def describe(self, name, text):
+        self._help[name] = text
+
+    def inc(self, name, labels=None, value=1.0):
+        key = (name, tuple(sorted((labels or {}).items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0.0) + value
+
+    def observe(self, name, value, labels=None):
+        key = (name, tuple(sorted((labels or {}).items())))
+        with self._lock:
+            hist = self._histograms.get(key)
+            if hist is None:
+                hist = self._histograms[key] = [[0] * len(self.buckets), 0, 0.0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    hist[0][i] += 1
+            hist[1] += 1
+            hist[2] += value
+
+    @staticmethod
+    def _labels(pairs, extra=()):
+        pairs = list(pairs) + list(extra)
+        if not pairs:
+            return ''
+        escaped = (str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, v in pairs)
+        return '{' + ','.join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + '}'
+
+    def render(self):
+        with self._lock:
+            counters = dict(self._counters)
+            histograms = {key: (list(h[0]), h[1], h[2]) for key, h in self._histograms.items()}
+        lines = []
+        for kind, series in (('counter', counters), ('histogram', histograms)):
+            for name in sorted({name for name, _ in series}):
+                if name in self._help:
+                    lines.append(f"# HELP {name} {self._help[name]}")
+                lines.append(f"# TYPE {name} {kind}")
+                for (metric, labels), value in sorted(series.items()):
+                    if metric != name:
+                        continue
+                    if kind == 'counter':
+                        lines.append(f"{name}{self._labels(labels)} {value:g}")
+                        continue
+                    bucket_counts, count, total = value
+                    for bound, bucket_count in zip(self.buckets, bucket_counts):
+                        lines.append(f"{name}_bucket{self._labels(labels, [('le', f'{bound:g}')])} {bucket_count}")
+                    lines.append(f"{name}_bucket{self._labels(labels, [('le', '+Inf')])} {count}")
+                    lines.append(f"{name}_sum{self._labels(labels)} {total:g}")
+                    lines.append(f"{name}_count{self._labels(labels)} {count}")
+        return "\n".join(lines) + "\n"
+
+
+metrics = Metrics()
+metrics.describe('http_requests_total', 'Requests handled, by route, method and status')
+metrics.describe('http_request_duration_seconds', 'Request wall time')
+metrics.describe('db_queries_total', 'SQL statements issued while handling requests')
+metrics.describe('db_query_seconds_total', 'Time spent in SQL statements')
+metrics.describe('model_inference_seconds_total', 'Time spent scoring medications')
+metrics.describe('external_http_seconds_total', 'Time spent waiting on external HTTP services')
+metrics.describe('profiled_requests_total', 'Requests run under the sampling profiler')
+
+TIMER_METRICS = {
+    'model': 'model_inference_seconds_total',
+    'http': 'external_http_seconds_total',
+}
+
+
+# Add the block's duration to the current request's `kind` timer; no-op outside requests
+@contextmanager
+def timed(kind):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        if has_request_context() and 'timings' in g:
+            g.timings[kind] = g.timings.get(kind, 0.0) + time.perf_counter() - started
+
+
+def _route():
+    return request.url_rule.rule if request.url_rule is not None else 'unmatched'
+
+
+# The start time lives on the statement's execution context, so a statement that
+# raises (no after_cursor_execute) leaves nothing behind
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if context is not None:
+        context._query_started = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = getattr(context, '_query_started', None)
+    if started is None:
+        return
+    if has_request_context() and 'timings' in g:
+        g.sql_count += 1
+        g.timings['sql'] = g.timings.get('sql', 0.0) + time.perf_counter() - started
+
+
+class SamplingProfiler:
+    """Runs a random fraction of requests under cProfile and saves the stats."""
+
+    def __init__(self, rate, directory):
+        self.rate = rate
+        self.directory = directory
+
+    def maybe_start(self):
+        if self.rate <= 0 or random.random() >= self.rate:
+            return None
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            # Another profiler is already active on this thread
+            return None
+        return profiler
+
+    def stop(self, profiler, route, duration):
+        profiler.disable()
+        os.makedirs(self.directory, exist_ok=True)
+        slug = route.strip('/').replace('/', '_').replace('<', '').replace('>', '') or 'root'
+        path = os.path.join(self.directory, f"{int(time.time() * 1000)}-{slug}.prof")
+        profiler.dump_stats(path)
+        metrics.inc('profiled_requests_total', {'route': route})
+        logger.info("Profiled request", extra={"route": route, "duration_ms": round(duration * 1000, 2),
+                                               "profile": path})
+
+
+def init_app(app, engine, profile_rate=None, profile_dir=None, slow_request_ms=None):
+    profile_rate = float(os.environ.get('PROFILE_SAMPLE_RATE', 0)) if profile_rate is None else profile_rate
+    profile_dir = profile_dir or os.environ.get('PROFILE_DIR', os.path.join(app.instance_path, 'profiles'))
+    slow_request_ms = float(os.environ.get('SLOW_REQUEST_MS', 1000)) if slow_request_ms is None else slow_request_ms
+    profiler = SamplingProfiler(profile_rate, profile_dir)
+    metrics_token = os.environ.get('METRICS_TOKEN')
+
+    event.listen(engine, 'before_cursor_execute', _before_cursor_execute)
+    event.listen(engine, 'after_cursor_execute', _after_cursor_execute)
+
+    @app.before_request
+    def _start_request():
+        g.request_started = time.perf_counter()
+        g.sql_count = 0
+        g.timings = {}
+        g.profiler = profiler.maybe_start()
+
+    @app.teardown_request
+    def _finish_request(exc=None):
+        if 'request_started' not in g:
+            return
+        duration = time.perf_counter() - g.request_started
+        route = _route()
+        if g.profiler is not None:
+            profiler.stop(g.profiler, route, duration)
+        status = getattr(g, 'response_status', 500 if exc is not None else 200)
+        labels = {'route': route}
+        metrics.inc('http_requests_total', {'route': route, 'method': request.method, 'status': str(status)})
+        metrics.observe('http_request_duration_seconds', duration, labels)
+        metrics.inc('db_queries_total', labels, g.sql_count)
+        metrics.inc('db_query_seconds_total', labels, g.timings.get('sql', 0.0))
+        for kind, name in TIMER_METRICS.items():
+            if kind in g.timings:
+                metrics.inc(name, labels, g.timings[kind])
+
+        duration_ms = duration * 1000
+        fields = {
+            "route": route, "method": request.method, "status": status, "duration_ms": round(duration_ms, 2),
+            "sql_count": g.sql_count,
+            **{f"{kind}_ms": round(seconds * 1000, 2) for kind, seconds in g.timings.items()},
+        }
+        if duration_ms >= slow_request_ms:
+            logger.warning("Slow request", extra=fields)
+        else:
+            logger.debug("Request", extra=fields)
+
+    @app.after_request
+    def _record_status(response):
+        g.response_status = response.status_code
+        return response
+
+    @app.route('/metrics')
+    def prometheus_metrics():
+        if metrics_token and request.headers.get('Authorization') != f"Bearer {metrics_token}":
+            abort(401)
+        return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+    return metrics
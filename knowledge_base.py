@@ -0,0 +1,122 @@
+import logging
+import os
+import threading
+import time
+
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+
+# Normalize a diagnosis name for index lookups
+def normalize(name):
+    return " ".join(str(name).split()).casefold()
+
+
+# Split a comma-joined CSV cell into a clean list
+def split_list(value):
+    if pd.isna(value):
+        return []
+    return [item.strip() for item in str(value).split(',') if item.strip()]
+
+
+def _cell(row, column):
+    value = row.get(column, '')
+    return '' if pd.isna(value) else str(value).strip()
+
+
+# Build {normalized diagnosis: entry} from diseases.csv.
+# Duplicate diagnoses are merged in ID order: medications and symptoms are
+# unioned (first-seen order), scalar fields come from the lowest-ID row.
+def build_index(path):
+    df = pd.read_csv(path, encoding='utf-8')
+    if 'ID' in df.columns:
+        df = df.sort_values('ID', kind='stable')
+
+    index = {}
+    for row in df.to_dict('records'):
+        key = normalize(row['Kasallik nomi'])
+        if not key:
+            continue
+        entry = index.get(key)
+        if entry is None:
+            entry = index[key] = {
+                "name": _cell(row, 'Kasallik nomi'),
+                "disease_type": _cell(row, 'Kasallik turi'),
+                "symptoms": [],
+                "recommended_meds": [],
+                "drug_type": _cell(row, 'Dori turi'),
+                "duration": _cell(row, 'Davolash muddati'),
+                "usage": _cell(row, 'Qabul qilish tartibi'),
+                "info": _cell(row, 'Qo‘shimcha ma’lumotlar'),
+            }
+        for symptom in split_list(row.get('Belgilar')):
+            if symptom not in entry["symptoms"]:
+                entry["symptoms"].append(symptom)
+        for med in split_list(row.get('Tavsiya etilgan dorilar')):
+            if med not in entry["recommended_meds"]:
+                entry["recommended_meds"].append(med)
+    return index
+
+
+class DiagnosisKnowledgeBase:
+    """In-memory diagnosis index over diseases.csv with mtime-based hot reload."""
+
+    def __init__(self, path, check_interval=5.0):
+        self.path = path
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._index = {}
+        self._mtime = None
+        self._last_check = 0.0
+        self._listeners = []
+        self.reload()
+
+    # Call callback(knowledge_base) after every successful reload
+    def on_reload(self, callback):
+        self._listeners.append(callback)
+
+    # Rebuild the index and swap it in atomically
+    def reload(self):
+        with self._lock:
+            mtime = os.path.getmtime(self.path)
+            self._index = build_index(self.path)
+            self._mtime = mtime
+            self._last_check = time.monotonic()
+        for callback in self._listeners:
+            callback(self)
+
+    # Reload if the CSV changed; stat() runs at most once per check_interval
+    def _maybe_reload(self):
+        now = time.monotonic()
+        if now - self._last_check < self.check_interval:
+            return
+        self._last_check = now
+        try:
+            mtime = os.path.getmtime(self.path)
+        except OSError:
+            return
+        if mtime != self._mtime:
+            try:
+                self.reload()
+            except (OSError, ValueError, KeyError) as e:
+                # Keep serving the previous index if the new file is broken
+                logger.error("Knowledge base reload failed", extra={"path": self.path, "error": str(e)})
+
+    def lookup(self, diagnosis):
+        self._maybe_reload()
+        return self._index.get(normalize(diagnosis))
+
+    def diagnoses(self):
+        self._maybe_reload()
+        return [entry["name"] for entry in self._index.values()]
+
+    def medications(self):
+        self._maybe_reload()
+        meds = {}
+        for entry in self._index.values():
+            meds.update(dict.fromkeys(entry["recommended_meds"]))
+        return list(meds)
+
+    def __len__(self):
+        return len(self._index)
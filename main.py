@@ -1,44 +1,49 @@
 from fastapi import FastAPI, HTTPException
 from pydantic import BaseModel
-from typing import List, Dict
+from typing import List, Dict, Optional
+import os
 import uuid
-import sqlite3  # Using SQLite for simplicity; replace with PostgreSQL in production
+import database
 from datetime import datetime
+import ai_model
 
 app = FastAPI()
+DB_PATH = 'prescriptions.db'
+# Connections are reused across requests instead of opened per call
+pool = database.ConnectionPool(DB_PATH, size=int(os.environ.get('DB_POOL_SIZE', 8)))
 
 
 # Database setup
 def init_db():
-    conn = sqlite3.connect('prescriptions.db')
-    c = conn.cursor()
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS prescriptions (
-            id TEXT PRIMARY KEY,
-            patient_id TEXT,
-            doctor_id TEXT,
-            diagnosis TEXT,
-            medications TEXT,
-            created_at TEXT
-        )
-    ''')
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS evaluations (
-            prescription_id TEXT,
-            medication TEXT,
-            is_appropriate BOOLEAN,
-            score INTEGER,
-            FOREIGN KEY (prescription_id) REFERENCES prescriptions (id)
-        )
-    ''')
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS doctor_ratings (
-            doctor_id TEXT PRIMARY KEY,
-            rating FLOAT
-        )
-    ''')
-    conn.commit()
-    conn.close()
+    with pool.connection() as conn:
+        c = conn.cursor()
+        c.execute('''
+            CREATE TABLE IF NOT EXISTS prescriptions (
+                id TEXT PRIMARY KEY,
+                patient_id TEXT,
+                doctor_id TEXT,
+                diagnosis TEXT,
+                medications TEXT,
+                created_at TEXT
+            )
+        ''')
+        c.execute('''
+            CREATE TABLE IF NOT EXISTS evaluations (
+                prescription_id TEXT,
+                medication TEXT,
+                is_appropriate BOOLEAN,
+                score INTEGER,
+                FOREIGN KEY (prescription_id) REFERENCES prescriptions (id)
+            )
+        ''')
+        c.execute('''
+            CREATE TABLE IF NOT EXISTS doctor_ratings (
+                doctor_id TEXT PRIMARY KEY,
+                rating FLOAT
+            )
+        ''')
+        # Evaluations are read by prescription_id in the listing JOIN
+        c.execute('CREATE INDEX IF NOT EXISTS ix_evaluations_prescription_id ON evaluations (prescription_id)')
 
 
 init_db()
@@ -66,6 +71,11 @@ class PharmacyCheck(BaseModel):
     medications: List[str]
 
 
+class MedicationPredict(BaseModel):
+    diagnosis: str
+    prescription: Optional[str] = None  # Without it only the recommended medications are returned
+
+
 # Mock AI evaluation (replace with real AI model in production)
 def evaluate_prescription(diagnosis: str, medications: List[str]) -> Dict:
     # Mock rules: e.g., "Painkiller" is appropriate for "Headache" but not for "Flu"
@@ -98,54 +108,70 @@ def check_pharmacies(medications: List[str]) -> List[Dict]:
     return results
 
 
-# Update doctor rating based on evaluations
-def update_doctor_rating(doctor_id: str):
-    conn = sqlite3.connect('prescriptions.db')
-    c = conn.cursor()
+# Recompute a doctor's rating inside the caller's transaction
+def update_doctor_rating(c, doctor_id: str):
     c.execute('''
-        SELECT score FROM evaluations e
+        INSERT OR REPLACE INTO doctor_ratings (doctor_id, rating)
+        SELECT ?, COALESCE(AVG(e.score), 0) FROM evaluations e
         JOIN prescriptions p ON e.prescription_id = p.id
         WHERE p.doctor_id = ?
-    ''', (doctor_id,))
-    scores = [row[0] for row in c.fetchall()]
-    avg_rating = sum(scores) / len(scores) if scores else 0
-    c.execute('''
-        INSERT OR REPLACE INTO doctor_ratings (doctor_id, rating)
-        VALUES (?, ?)
-    ''', (doctor_id, avg_rating))
-    conn.commit()
-    conn.close()
-
-
-# API endpoints
+    ''', (doctor_id, doctor_id))
+
+
+# Prescriptions with their evaluations from one LEFT JOIN, in created_at order
+def fetch_prescriptions(c, prescription_id: Optional[str] = None) -> List[Dict]:
+    where = "WHERE p.id = ?" if prescription_id is not None else ""
+    c.execute(f'''
+        SELECT p.id, p.patient_id, p.doctor_id, p.diagnosis, p.medications, p.created_at,
+               e.medication, e.is_appropriate, e.score
+        FROM prescriptions p
+        LEFT JOIN evaluations e ON e.prescription_id = p.id
+        {where}
+        ORDER BY p.created_at, p.id
+    ''', (prescription_id,) if prescription_id is not None else ())
+    results = {}
+    for row in c.fetchall():
+        pres = results.get(row[0])
+        if pres is None:
+            pres = results[row[0]] = {
+                "id": row[0],
+                "patient_id": row[1],
+                "doctor_id": row[2],
+                "diagnosis": row[3],
+                "medications": row[4].split(','),
+                "created_at": row[5],
+                "evaluation": {}
+            }
+        if row[6] is not None:
+            pres["evaluation"][row[6]] = {"is_appropriate": row[7], "score": row[8]}
+    return list(results.values())
+
+
+# API endpoints. Handlers are plain "def": FastAPI runs them in its threadpool,
+# so blocking database and model calls don't stall the event loop.
 @app.post("/prescriptions", response_model=PrescriptionResponse)
-async def create_prescription(prescription: PrescriptionCreate):
+def create_prescription(prescription: PrescriptionCreate):
     prescription_id = str(uuid.uuid4())
     created_at = datetime.utcnow().isoformat()
     medications_str = ','.join(prescription.medications)
 
-    # Save to database
-    conn = sqlite3.connect('prescriptions.db')
-    c = conn.cursor()
-    c.execute('''
-        INSERT INTO prescriptions (id, patient_id, doctor_id, diagnosis, medications, created_at)
-        VALUES (?, ?, ?, ?, ?, ?)
-    ''', (prescription_id, prescription.patient_id, prescription.doctor_id, prescription.diagnosis, medications_str,
-          created_at))
-
     # Evaluate prescription
     evaluation = evaluate_prescription(prescription.diagnosis, prescription.medications)
-    for med, eval_data in evaluation.items():
+
+    # Save prescription, evaluations and the doctor's new rating in one transaction
+    with pool.connection() as conn:
+        c = conn.cursor()
         c.execute('''
+            INSERT INTO prescriptions (id, patient_id, doctor_id, diagnosis, medications, created_at)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', (prescription_id, prescription.patient_id, prescription.doctor_id, prescription.diagnosis, medications_str,
+              created_at))
+        c.executemany('''
             INSERT INTO evaluations (prescription_id, medication, is_appropriate, score)
             VALUES (?, ?, ?, ?)
-        ''', (prescription_id, med, eval_data["is_appropriate"], eval_data["score"]))
-
-    conn.commit()
-    conn.close()
-
-    # Update doctor rating
-    update_doctor_rating(prescription.doctor_id)
+        ''', [(prescription_id, med, eval_data["is_appropriate"], eval_data["score"])
+              for med, eval_data in evaluation.items()])
+        update_doctor_rating(c, prescription.doctor_id)
 
     return {
         "id": prescription_id,
@@ -159,50 +185,18 @@ async def create_prescription(prescription: PrescriptionCreate):
 
 
 @app.get("/prescriptions", response_model=List[PrescriptionResponse])
-async def get_prescriptions():
-    conn = sqlite3.connect('prescriptions.db')
-    c = conn.cursor()
-    c.execute('SELECT * FROM prescriptions')
-    prescriptions = c.fetchall()
-    results = []
-    for pres in prescriptions:
-        c.execute('SELECT medication, is_appropriate, score FROM evaluations WHERE prescription_id = ?', (pres[0],))
-        eval_rows = c.fetchall()
-        evaluation = {row[0]: {"is_appropriate": row[1], "score": row[2]} for row in eval_rows}
-        results.append({
-            "id": pres[0],
-            "patient_id": pres[1],
-            "doctor_id": pres[2],
-            "diagnosis": pres[3],
-            "medications": pres[4].split(','),
-            "created_at": pres[5],
-            "evaluation": evaluation
-        })
-    conn.close()
-    return results
+def get_prescriptions():
+    with pool.connection() as conn:
+        return fetch_prescriptions(conn.cursor())
 
 
 @app.get("/prescriptions/{id}", response_model=PrescriptionResponse)
-async def get_prescription(id: str):
-    conn = sqlite3.connect('prescriptions.db')
-    c = conn.cursor()
-    c.execute('SELECT * FROM prescriptions WHERE id = ?', (id,))
-    pres = c.fetchone()
-    if not pres:
+def get_prescription(id: str):
+    with pool.connection() as conn:
+        found = fetch_prescriptions(conn.cursor(), id)
+    if not found:
         raise HTTPException(status_code=404, detail="Prescription not found")
-    c.execute('SELECT medication, is_appropriate, score FROM evaluations WHERE prescription_id = ?', (id,))
-    eval_rows = c.fetchall()
-    evaluation = {row[0]: {"is_appropriate": row[1], "score": row[2]} for row in eval_rows}
-    conn.close()
-    return {
-        "id": pres[0],
-        "patient_id": pres[1],
-        "doctor_id": pres[2],
-        "diagnosis": pres[3],
-        "medications": pres[4].split(','),
-        "created_at": pres[5],
-        "evaluation": evaluation
-    }
+    return found[0]
 
 
 @app.post("/check-pharmacies")
@@ -210,11 +204,26 @@ async def check_pharmacies_endpoint(data: PharmacyCheck):
     return check_pharmacies(data.medications)
 
 
+# The NER model loads on the first request, not at startup
+@app.post("/predict")
+def predict(data: MedicationPredict):
+    try:
+        return ai_model.predict_medication(data.diagnosis, data.prescription)
+    except RuntimeError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+
+
+@app.post("/predict/batch")
+def predict_batch(data: List[MedicationPredict]):
+    try:
+        return ai_model.predict_medications([(item.diagnosis, item.prescription) for item in data])
+    except RuntimeError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+
+
 @app.get("/doctor-ratings")
-async def get_doctor_ratings():
-    conn = sqlite3.connect('prescriptions.db')
-    c = conn.cursor()
-    c.execute('SELECT doctor_id, rating FROM doctor_ratings')
-    ratings = [{"doctor_id": row[0], "rating": row[1]} for row in c.fetchall()]
-    conn.close()
-    return ratings
\ No newline at end of file
+def get_doctor_ratings():
+    with pool.connection() as conn:
+        c = conn.cursor()
+        c.execute('SELECT doctor_id, rating FROM doctor_ratings')
+        return [{"doctor_id": row[0], "rating": row[1]} for row in c.fetchall()]
\ No newline at end of file
@@ -0,0 +1,183 @@
+"""Fuzzy medication name resolution.
+
+Names are normalized (casefold, Cyrillic to Latin, common spelling variants
+such as c/ts, x/ks folded) and indexed by character trigrams once, so
+"metformin", "Paracetamol" and "Азитромицин" resolve to the catalog's
+"Metformin", "Paratsetamol" and "Azitromitsin". Names too far apart to
+match by spelling (brand or colloquial names such as "Парастамик") are
+mapped with an alias file, see ``load_aliases``.
+"""
+import csv
+import heapq
+import os
+import re
+import unicodedata
+from collections import defaultdict
+from difflib import SequenceMatcher
+
+# Cyrillic (Russian + Uzbek) to Uzbek Latin
+CYRILLIC_TO_LATIN = {
+    'а': 'a', 'б': 'b', 'в': 'v', 'г': 'g', 'д': 'd', 'е': 'e', 'ё': 'yo', 'ж': 'j', 'з': 'z',
+    'и': 'i', 'й': 'y', 'к': 'k', 'л': 'l', 'м': 'm', 'н': 'n', 'о': 'o', 'п': 'p', 'р': 'r',
+    'с': 's', 'т': 't', 'у': 'u', 'ф': 'f', 'х': 'h', 'ц': 'ts', 'ч': 'ch', 'ш': 'sh', 'щ': 'sh',
+    'ъ': '', 'ы': 'i', 'ь': '', 'э': 'e', 'ю': 'yu', 'я': 'ya', 'ў': 'o', 'қ': 'q', 'ғ': 'g', 'ҳ': 'h',
+}
+
+# Spelling variants that sound the same (International vs Uzbek Latin drug names)
+PHONETIC_RULES = [
+    (re.compile(r'c(?=[eiy])'), 'ts'),
+    (re.compile(r'ck|c'), 'k'),
+    (re.compile(r'ph'), 'f'),
+    (re.compile(r'x'), 'ks'),
+    (re.compile(r'th'), 't'),
+    (re.compile(r'w'), 'v'),
+    (re.compile(r'y'), 'i'),
+    (re.compile(r'(.)\1+'), r'\1'),
+    (re.compile(r'(?<=\w\w\w)e$'), ''),
+]
+
+
+# Casefold, transliterate to Latin, fold spelling variants, drop punctuation
+def normalize(name):
+    text = unicodedata.normalize('NFKC', str(name)).casefold()
+    text = "".join(CYRILLIC_TO_LATIN.get(ch, ch) for ch in text)
+    text = re.sub(r"[^\w]+", "", text).replace('_', '')
+    for pattern, replacement in PHONETIC_RULES:
+        text = pattern.sub(replacement, text)
+    return text
+
+
+# Optimal string alignment distance: insertions, deletions, substitutions and
+# adjacent transpositions; stops early once it must exceed `limit`
+def edit_distance(a, b, limit=None):
+    if limit is not None and abs(len(a) - len(b)) > limit:
+        return limit + 1
+    before, previous = None, list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        current = [i] + [0] * len(b)
+        for j, cb in enumerate(b, 1):
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ca != cb))
+            if i > 1 and j > 1 and ca == b[j - 2] and a[i - 2] == cb:
+                current[j] = min(current[j], before[j - 2] + 1)
+        if limit is not None and min(current) > limit:
+            return limit + 1
+        before, previous = previous, current
+    return previous[-1]
+
+
+def trigrams(text):
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+# (alias, medication) pairs from a two-column CSV with an "alias,medication" header;
+# empty if the file doesn't exist
+def load_aliases(path):
+    if not path or not os.path.exists(path):
+        return []
+    with open(path, encoding='utf-8', newline='') as f:
+        return [(row['alias'].strip(), row['medication'].strip()) for row in csv.DictReader(f)
+                if row.get('alias') and row.get('medication')]
+
+
+class MedicationResolver:
+    """Trigram index over known medication names.
+
+    ``resolve`` shortlists names sharing trigrams with the query (by Dice
+    similarity), then ranks the shortlist by edit similarity of the
+    normalized names and returns the top-k (name, score 0-100).
+
+    ``match`` is stricter, because a score alone can't tell a typo from a
+    different drug with the same stem (Esomeprazol/Omeprazol,
+    Valsartan/Losartan). The best name must score at least ``min_score``,
+    be within ``max_edits`` edits of the query after normalization, and lead
+    the runner-up by ``min_margin``.
+    """
+
+    shortlist = 5
+
+    def __init__(self, names=(), min_score=75, aliases=(), max_edits=1, min_margin=5.0):
+        self.min_score = min_score
+        self.max_edits = max_edits
+        self.min_margin = min_margin
+        self._names = []
+        self._normals = []
+        self._grams = []
+        self._by_normal = {}
+        self._index = defaultdict(list)
+        for name in names:
+            self.add(name)
+        for alias, name in aliases:
+            self.add_alias(alias, name)
+
+    def add(self, name):
+        normal = normalize(name)
+        if not normal or normal in self._by_normal:
+            return
+        i = len(self._names)
+        grams = trigrams(normal)
+        self._names.append(name)
+        self._normals.append(normal)
+        self._grams.append(grams)
+        self._by_normal[normal] = name
+        for gram in grams:
+            self._index[gram].append(i)
+
+    # Resolve `alias` exactly to the known `name`; ignored if name isn't known
+    def add_alias(self, alias, name):
+        normal = normalize(alias)
+        target = self._by_normal.get(normalize(name))
+        if normal and target is not None:
+            self._by_normal.setdefault(normal, target)
+
+    # Top-k (score, name index) for a normalized, non-exact query
+    def _ranked(self, normal, k):
+        grams = trigrams(normal)
+        shared = defaultdict(int)
+        for gram in grams:
+            for i in self._index.get(gram, ()):
+                shared[i] += 1
+        dice = ((count / (len(grams) + len(self._grams[i])), i) for i, count in shared.items())
+        candidates = heapq.nlargest(max(k, self.shortlist), dice)
+        scored = ((100.0 * SequenceMatcher(None, normal, self._normals[i]).ratio(), i) for _, i in candidates)
+        return heapq.nlargest(k, scored)
+
+    def resolve(self, query, k=5):
+        normal = normalize(query)
+        if not normal:
+            return []
+        exact = self._by_normal.get(normal)
+        if exact is not None:
+            return [(exact, 100.0)]
+        return [(self._names[i], round(score, 1)) for score, i in self._ranked(normal, k)]
+
+    # (known name, score) for query, or None when no name is close enough (see class docstring)
+    def best(self, query, min_score=None):
+        normal = normalize(query)
+        if not normal:
+            return None
+        exact = self._by_normal.get(normal)
+        if exact is not None:
+            return exact, 100.0
+        ranked = self._ranked(normal, 2)
+        if not ranked:
+            return None
+        score, i = ranked[0]
+        threshold = self.min_score if min_score is None else min_score
+        if score < threshold or (len(ranked) > 1 and score - ranked[1][0] < self.min_margin):
+            return None
+        if edit_distance(normal, self._normals[i], self.max_edits) > self.max_edits:
+            return None
+        return self._names[i], round(score, 1)
+
+    # Best known name for query, or None when nothing is close enough
+    def match(self, query, min_score=None):
+        best = self.best(query, min_score)
+        return best[0] if best is not None else None
+
+    # Known name for query if it resolves, otherwise query unchanged
+    def canonical(self, query):
+        return self.match(query) or query
+
+    def __len__(self):
+        return len(self._names)
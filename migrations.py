@@ -0,0 +1,172 @@
+import logging
+from datetime import datetime
+
+from sqlalchemy import inspect, text
+
+logger = logging.getLogger(__name__)
+
+# Ordered list of (name, function); each runs once per database and is
+# recorded in the schema_migration table. Functions receive a connection
+# inside an open transaction.
+MIGRATIONS = []
+
+
+def migration(name):
+    def register(func):
+        MIGRATIONS.append((name, func))
+        return func
+    return register
+
+
+def has_column(conn, table, column):
+    return column in {c['name'] for c in inspect(conn).get_columns(table)}
+
+
+def add_column(conn, table, column, ddl):
+    if not has_column(conn, table, column):
+        conn.execute(text(f'ALTER TABLE "{table}" ADD COLUMN {column} {ddl}'))
+
+
+# Apply pending migrations; run after db.create_all()
+def run_migrations(db):
+    with db.engine.begin() as conn:
+        conn.execute(text(
+            "CREATE TABLE IF NOT EXISTS schema_migration ("
+            "name VARCHAR(100) PRIMARY KEY, applied_at TIMESTAMP NOT NULL)"
+        ))
+        applied = {row[0] for row in conn.execute(text("SELECT name FROM schema_migration"))}
+    for name, func in MIGRATIONS:
+        if name in applied:
+            continue
+        with db.engine.begin() as conn:
+            func(conn)
+            conn.execute(text("INSERT INTO schema_migration (name, applied_at) VALUES (:name, :at)"),
+                         {"name": name, "at": datetime.utcnow()})
+        logger.info("Applied migration", extra={"migration": name})
+
+
+# Rebuild every doctor's rating from one grouped aggregate over prescriptions
+def recompute_doctor_ratings(conn):
+    totals = conn.execute(text(
+        "SELECT doctor_id, COALESCE(SUM(ai_score), 0), COUNT(*) FROM prescription GROUP BY doctor_id"
+    )).fetchall()
+    conn.execute(text("UPDATE \"user\" SET rating_sum = 0, rating_count = 0, rating = 0.0 WHERE role = 'doctor'"))
+    if totals:
+        conn.execute(
+            text("UPDATE \"user\" SET rating_sum = :total, rating_count = :count, rating = :rating WHERE id = :id"),
+            [{"id": doctor_id, "total": total, "count": count, "rating": total / count}
+             for doctor_id, total, count in totals]
+        )
+    return len(totals)
+
+
+@migration('0001_user_rating_counters')
+def _user_rating_counters(conn):
+    add_column(conn, 'user', 'rating_sum', 'FLOAT NOT NULL DEFAULT 0')
+    add_column(conn, 'user', 'rating_count', 'INTEGER NOT NULL DEFAULT 0')
+    recompute_doctor_ratings(conn)
+
+
+@migration('0002_patient_id_sequence')
+def _patient_id_sequence(conn):
+    conn.execute(text(
+        "CREATE TABLE IF NOT EXISTS id_sequence (name VARCHAR(50) PRIMARY KEY, value INTEGER NOT NULL)"
+    ))
+    rows = conn.execute(text("SELECT id, patient_id FROM prescription ORDER BY created_at, id")).fetchall()
+
+    # Old allocation sorted patient_id as text, so "9" > "10" handed out duplicates.
+    # Keep the first holder of each numeric id, renumber the rest past the maximum.
+    numeric = [int(pid) for _, pid in rows if str(pid).isdigit()]
+    next_id = max(numeric, default=0)
+    seen = set()
+    fixes = []
+    for prescription_id, pid in rows:
+        if str(pid).isdigit() and int(pid) not in seen:
+            seen.add(int(pid))
+            if str(int(pid)) != pid:
+                fixes.append({"id": prescription_id, "pid": str(int(pid))})
+            continue
+        next_id += 1
+        fixes.append({"id": prescription_id, "pid": str(next_id)})
+    if fixes:
+        conn.execute(text("UPDATE prescription SET patient_id = :pid WHERE id = :id"), fixes)
+        logger.info("Renumbered duplicate or non-numeric patient ids", extra={"count": len(fixes)})
+
+    conn.execute(text("DELETE FROM id_sequence WHERE name = 'patient_id'"))
+    conn.execute(text("INSERT INTO id_sequence (name, value) VALUES ('patient_id', :value)"), {"value": next_id})
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_prescription_patient_id ON prescription (patient_id)"))
+
+
+@migration('0003_listing_indexes')
+def _listing_indexes(conn):
+    for name, table, columns in [
+        ('ix_prescription_created_at_id', 'prescription', 'created_at, id'),
+        ('ix_prescription_doctor_created_at', 'prescription', 'doctor_id, created_at'),
+        ('ix_audit_log_created_at_id', 'audit_log', 'created_at, id'),
+        ('ix_audit_log_user_created_at', 'audit_log', 'user_id, created_at'),
+        ('ix_audit_log_action_created_at', 'audit_log', 'action, created_at'),
+    ]:
+        conn.execute(text(f"CREATE INDEX IF NOT EXISTS {name} ON {table} ({columns})"))
+
+
+def _split(value):
+    return [item.strip() for item in (value or '').split(',') if item.strip()]
+
+
+@migration('0004_prescription_medication')
+def _prescription_medication(conn):
+    conn.execute(text(
+        "CREATE TABLE IF NOT EXISTS prescription_medication ("
+        "id INTEGER PRIMARY KEY, "
+        "prescription_id VARCHAR(36) NOT NULL REFERENCES prescription (id), "
+        "position INTEGER NOT NULL DEFAULT 0, "
+        "medication VARCHAR(100) NOT NULL, "
+        "confidence FLOAT, "
+        "is_prescribed BOOLEAN NOT NULL DEFAULT 1, "
+        "is_correct BOOLEAN NOT NULL DEFAULT 0, "
+        "is_essential BOOLEAN NOT NULL DEFAULT 0)"
+    ))
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_prescription_medication_prescription_id "
+                      "ON prescription_medication (prescription_id)"))
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_prescription_medication_medication "
+                      "ON prescription_medication (medication)"))
+
+    # Backfill from the comma-joined columns for prescriptions that have no rows yet
+    result = conn.execute(text(
+        "SELECT id, medications, correct_meds, essential_meds, confidence_scores FROM prescription "
+        "WHERE id NOT IN (SELECT DISTINCT prescription_id FROM prescription_medication)"
+    ))
+    rows = []
+    for prescription_id, medications, correct_meds, essential_meds, confidence_scores in result:
+        medications = _split(medications)
+        correct = set(_split(correct_meds))
+        essential = _split(essential_meds)
+        confidence = {}
+        for item in _split(confidence_scores):
+            med, _, conf = item.rpartition(':')
+            try:
+                confidence[med.strip()] = float(conf)
+            except ValueError:
+                continue
+        for i, med in enumerate(medications):
+            rows.append({"pid": prescription_id, "pos": i, "med": med, "conf": confidence.get(med),
+                         "prescribed": True, "correct": med in correct, "essential": med in essential})
+        missing = [med for med in essential if med not in set(medications)]
+        for i, med in enumerate(missing):
+            rows.append({"pid": prescription_id, "pos": len(medications) + i, "med": med, "conf": None,
+                         "prescribed": False, "correct": False, "essential": True})
+    if rows:
+        conn.execute(text(
+            "INSERT INTO prescription_medication "
+            "(prescription_id, position, medication, confidence, is_prescribed, is_correct, is_essential) "
+            "VALUES (:pid, :pos, :med, :conf, :prescribed, :correct, :essential)"
+        ), rows)
+        logger.info("Backfilled prescription_medication rows", extra={"count": len(rows)})
+
+
+@migration('0005_import_checkpoint')
+def _import_checkpoint(conn):
+    conn.execute(text(
+        "CREATE TABLE IF NOT EXISTS import_checkpoint "
+        "(source VARCHAR(255) PRIMARY KEY, rows_done INTEGER NOT NULL, updated_at DATETIME)"
+    ))
@@ -0,0 +1,274 @@
+"""Compact, memory-mappable export of the medication model.
+
+The TF-IDF vocabulary, IDF weights and every tree of the random forest are
+flattened into plain NumPy arrays in a directory:
+
+    meta.json       format/model version, vectorizer settings, classes
+    vocabulary.json term -> column index
+    idf.npy         IDF weight per column
+    feature.npy, threshold.npy, left.npy, right.npy, value.npy
+                    all trees' nodes back to back (children use global ids)
+    roots.npy       first node of each tree
+
+CompactModel loads it with mmap_mode='r' (pages are shared read-only
+between processes) and predicts with vectorized NumPy, matching the sklearn
+pipeline's predict_proba.
+
+    python model_artifact.py export medication_model.pkl medication_model
+    python model_artifact.py verify medication_model.pkl medication_model
+    python model_artifact.py bench medication_model.pkl medication_model
+
+``bench`` times both predictors at several batch sizes and fails if the
+artifact is more than MAX_SLOWDOWN times slower than the pipeline at any.
+"""
+import argparse
+import hashlib
+import json
+import os
+import pickle
+import re
+import sys
+import time
+from collections import Counter
+
+import numpy as np
+
+FORMAT_VERSION = 1
+ARRAYS = ('idf', 'feature', 'threshold', 'left', 'right', 'value', 'roots')
+# Rows predicted together, and tree levels stepped between dropping finished (row, tree) pairs
+BLOCK_ROWS = 256
+LEVELS_PER_PASS = 2
+# Allowed CompactModel / pipeline predict_proba time in `bench`
+MAX_SLOWDOWN = 2.5
+BENCH_SIZES = (1, 32, 512, None)
+
+
+def model_version(path):
+    with open(path, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()[:16]
+
+
+def _check_vectorizer(vectorizer):
+    params = vectorizer.get_params()
+    unsupported = {
+        'analyzer': 'word', 'preprocessor': None, 'tokenizer': None, 'stop_words': None,
+        'strip_accents': None, 'binary': False, 'norm': 'l2',
+    }
+    for name, expected in unsupported.items():
+        if params[name] != expected:
+            raise ValueError(f"Cannot export TfidfVectorizer with {name}={params[name]!r}")
+
+
+# Write the fitted TfidfVectorizer + RandomForestClassifier pipeline to directory
+def export_artifact(pipeline, directory, version=None):
+    vectorizer = pipeline.named_steps['tfidf']
+    forest = pipeline.named_steps['clf']
+    _check_vectorizer(vectorizer)
+
+    features, thresholds, lefts, rights, values, roots = [], [], [], [], [], []
+    offset = 0
+    for estimator in forest.estimators_:
+        tree = estimator.tree_
+        roots.append(offset)
+        features.append(tree.feature.astype(np.int32))
+        thresholds.append(tree.threshold.astype(np.float64))
+        left = tree.children_left.astype(np.int32)
+        right = tree.children_right.astype(np.int32)
+        lefts.append(np.where(left >= 0, left + offset, -1).astype(np.int32))
+        rights.append(np.where(right >= 0, right + offset, -1).astype(np.int32))
+        value = tree.value[:, 0, :].astype(np.float64)
+        totals = value.sum(axis=1, keepdims=True)
+        values.append(np.divide(value, totals, out=np.zeros_like(value), where=totals > 0))
+        offset += tree.node_count
+
+    os.makedirs(directory, exist_ok=True)
+    arrays = {
+        'idf': vectorizer.idf_.astype(np.float64),
+        'feature': np.concatenate(features),
+        'threshold': np.concatenate(thresholds),
+        'left': np.concatenate(lefts),
+        'right': np.concatenate(rights),
+        'value': np.concatenate(values),
+        'roots': np.asarray(roots, dtype=np.int32),
+    }
+    for name, array in arrays.items():
+        np.save(os.path.join(directory, f"{name}.npy"), array)
+    with open(os.path.join(directory, 'vocabulary.json'), 'w', encoding='utf-8') as f:
+        json.dump({term: int(i) for term, i in vectorizer.vocabulary_.items()}, f, ensure_ascii=False)
+    meta = {
+        'format_version': FORMAT_VERSION,
+        'model_version': version,
+        'classes': [int(c) for c in forest.classes_],
+        'lowercase': vectorizer.lowercase,
+        'token_pattern': vectorizer.token_pattern,
+        'ngram_range': list(vectorizer.ngram_range),
+        'sublinear_tf': vectorizer.sublinear_tf,
+        'use_idf': vectorizer.use_idf,
+        'n_trees': len(roots),
+        'n_nodes': int(offset),
+    }
+    with open(os.path.join(directory, 'meta.json'), 'w', encoding='utf-8') as f:
+        json.dump(meta, f, indent=2)
+    return meta
+
+
+class CompactModel:
+    """Pure-NumPy predictor for an exported artifact; exposes predict_proba like the pipeline."""
+
+    def __init__(self, directory, mmap=True):
+        self.directory = directory
+        with open(os.path.join(directory, 'meta.json'), encoding='utf-8') as f:
+            self.meta = json.load(f)
+        if self.meta['format_version'] != FORMAT_VERSION:
+            raise ValueError(f"Unsupported model artifact format {self.meta['format_version']}")
+        with open(os.path.join(directory, 'vocabulary.json'), encoding='utf-8') as f:
+            self.vocabulary = json.load(f)
+        mode = 'r' if mmap else None
+        for name in ARRAYS:
+            setattr(self, name, np.load(os.path.join(directory, f"{name}.npy"), mmap_mode=mode))
+        self._token_re = re.compile(self.meta['token_pattern'])
+        self.version = self.meta.get('model_version')
+        self.classes_ = np.asarray(self.meta['classes'])
+        self._prepare()
+
+    def _terms(self, text):
+        if self.meta['lowercase']:
+            text = text.lower()
+        tokens = self._token_re.findall(text)
+        low, high = self.meta['ngram_range']
+        if (low, high) == (1, 1):
+            return tokens
+        terms = tokens[:] if low == 1 else []
+        for n in range(max(2, low), high + 1):
+            terms.extend(" ".join(tokens[i:i + n]) for i in range(len(tokens) - n + 1))
+        return terms
+
+    # Dense, L2-normalized TF-IDF matrix for rows, like TfidfVectorizer.transform(rows).toarray()
+    def transform(self, rows):
+        X = np.zeros((len(rows), len(self.idf)))
+        for i, text in enumerate(rows):
+            counts = X[i]
+            for term in self._terms(text):
+                column = self.vocabulary.get(term)
+                if column is not None:
+                    counts[column] += 1
+        if self.meta['sublinear_tf']:
+            np.log(X, out=X, where=X > 0)
+            X[X != 0] += 1
+        if self.meta['use_idf']:
+            X *= self.idf
+        norms = np.sqrt(np.einsum('ij,ij->i', X, X))[:, None]
+        np.divide(X, norms, out=X, where=norms > 0)
+        return X
+
+    # Lookup tables for traversal, derived once from the node arrays. Nodes are addressed as
+    # 2 * node + go_right, so one step is child[state + go_right] with no index arithmetic.
+    def _prepare(self):
+        leaf = self.left < 0
+        nodes = np.arange(len(leaf))
+        # Trees test float32 features against float64 thresholds, as sklearn does. Rounding the
+        # threshold down to float32 gives the same answer for float32 x; leaves never go right.
+        threshold = np.array(self.threshold, dtype=np.float32)
+        rounded_up = threshold.astype(np.float64) > self.threshold
+        threshold[rounded_up] = np.nextafter(threshold[rounded_up], np.float32(-np.inf))
+        threshold[leaf] = np.inf
+        self._leaf = np.repeat(leaf, 2)
+        self._feature = np.repeat(np.where(leaf, 0, self.feature).astype(np.intp), 2)
+        self._threshold = np.repeat(threshold, 2)
+        # Leaves step to themselves
+        self._child = np.empty(2 * len(leaf), dtype=np.intp)
+        self._child[0::2] = 2 * np.where(leaf, nodes, self.left)
+        self._child[1::2] = 2 * np.where(leaf, nodes, self.right)
+        self._roots = 2 * np.asarray(self.roots, dtype=np.intp)
+        self._value_by_class = np.ascontiguousarray(self.value.T)
+
+    # Leaf reached by each row of the float32 feature matrix X, per tree: (n_trees, n_rows)
+    def _leaves(self, X):
+        n_rows, n_columns = X.shape
+        flat = X.ravel()
+        state = np.repeat(self._roots, n_rows)
+        offset = np.tile(np.arange(n_rows, dtype=np.intp) * n_columns, len(self._roots))
+        leaves = state
+        pending = np.arange(state.size)
+        # Only (row, tree) pairs that haven't reached a leaf are stepped, dropping finished
+        # ones every LEVELS_PER_PASS levels
+        while state.size:
+            for _ in range(LEVELS_PER_PASS):
+                go_right = flat[offset + self._feature[state]] > self._threshold[state]
+                state = self._child[state + go_right]
+            leaves[pending] = state
+            keep = np.flatnonzero(~self._leaf[state])
+            pending, state, offset = pending[keep], state[keep], offset[keep]
+        return (leaves // 2).reshape(len(self._roots), n_rows)
+
+    def predict_proba(self, rows):
+        rows = list(rows)
+        X = self.transform(rows).astype(np.float32)
+        proba = np.empty((len(rows), len(self.classes_)))
+        # Blocks keep the per-pair arrays small enough to stay in cache
+        for start in range(0, len(rows), BLOCK_ROWS):
+            leaves = self._leaves(X[start:start + BLOCK_ROWS])
+            for column, value in enumerate(self._value_by_class):
+                # Summed tree by tree, in sklearn's order
+                proba[start:start + BLOCK_ROWS, column] = value[leaves].sum(axis=0) / len(self._roots)
+        return proba
+
+
+# Rows covering every diagnosis / medication pair, plus a few edge cases
+def _sample_rows():
+    import pandas as pd
+    df = pd.read_csv('diseases.csv', encoding='utf-8')
+    meds = sorted(set(df['Tavsiya etilgan dorilar'].str.split(',').explode().str.strip()))
+    rows = [f"{d} {s} {m}" for d, s in zip(df['Kasallik nomi'], df['Belgilar']) for m in meds]
+    return rows + ["unknown words only", "", "Astma Metformin Metformin"]
+
+
+# Best-of-`repeat` seconds for each predictor on rows, alternating so both see the same load
+def _best_times(predictors, rows, repeat=9):
+    best = [float('inf')] * len(predictors)
+    for _ in range(repeat + 1):
+        for i, predict in enumerate(predictors):
+            started = time.perf_counter()
+            predict(rows)
+            best[i] = min(best[i], time.perf_counter() - started)
+    return best
+
+
+def bench(pipeline, artifact, rows):
+    failures = 0
+    for size in BENCH_SIZES:
+        batch = rows[:size]
+        expected, actual = _best_times((pipeline.predict_proba, artifact.predict_proba), batch)
+        ratio = actual / expected
+        print(f"{len(batch):5d} rows: pipeline {expected * 1000:7.1f} ms, artifact {actual * 1000:7.1f} ms "
+              f"({ratio:.2f}x)")
+        failures += ratio > MAX_SLOWDOWN
+    return 1 if failures else 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export, verify or time the compact medication model artifact")
+    parser.add_argument('command', choices=['export', 'verify', 'bench'])
+    parser.add_argument('pickle_path')
+    parser.add_argument('artifact_dir')
+    args = parser.parse_args(argv)
+
+    with open(args.pickle_path, 'rb') as f:
+        pipeline = pickle.load(f)
+    if args.command == 'export':
+        meta = export_artifact(pipeline, args.artifact_dir, version=model_version(args.pickle_path))
+        print(f"Exported {meta['n_trees']} trees / {meta['n_nodes']} nodes to {args.artifact_dir}")
+        return 0
+
+    rows = _sample_rows()
+    if args.command == 'bench':
+        return bench(pipeline, CompactModel(args.artifact_dir), rows)
+    expected = pipeline.predict_proba(rows)
+    actual = CompactModel(args.artifact_dir).predict_proba(rows)
+    diff = float(np.abs(expected - actual).max())
+    print(f"Compared {len(rows)} rows, max abs difference {diff:.2e}")
+    return 0 if diff < 1e-9 else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
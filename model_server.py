@@ -0,0 +1,196 @@
+"""Local model server: one process holds the medication model and serves
+predict_proba to every app worker over HTTP on localhost.
+
+    python model_server.py --port 8601
+    MODEL_SERVER_URL=http://127.0.0.1:8601 gunicorn -w 8 app:app
+
+Concurrent requests are collected for up to --batch-window milliseconds and
+scored with one predict_proba call.
+"""
+import argparse
+import json
+import logging
+import os
+import pickle
+import threading
+import time
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from queue import Empty, Queue
+
+import numpy as np
+import requests
+
+from model_artifact import CompactModel, model_version
+
+logger = logging.getLogger(__name__)
+
+
+class MicroBatcher:
+    """Collects rows from concurrent callers and scores them in one call."""
+
+    def __init__(self, model, window=0.005, max_rows=512):
+        self.model = model
+        self.window = window
+        self.max_rows = max_rows
+        self._queue = Queue()
+        self.batches = 0
+        self.rows = 0
+        self.requests = 0
+        self._thread = threading.Thread(target=self._run, name='model-batcher', daemon=True)
+        self._thread.start()
+
+    def predict_proba(self, rows):
+        future = Future()
+        self._queue.put((list(rows), future))
+        return future.result()
+
+    def _run(self):
+        while True:
+            pending = [self._queue.get()]
+            size = len(pending[0][0])
+            deadline = time.monotonic() + self.window
+            while size < self.max_rows:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except Empty:
+                    break
+                pending.append(item)
+                size += len(item[0])
+
+            rows = [row for item_rows, _ in pending for row in item_rows]
+            try:
+                probabilities = np.asarray(self.model.predict_proba(rows)) if rows else np.empty((0, 2))
+            except Exception as e:
+                for _, future in pending:
+                    future.set_exception(e)
+                continue
+            self.batches += 1
+            self.rows += len(rows)
+            self.requests += len(pending)
+            offset = 0
+            for item_rows, future in pending:
+                future.set_result(probabilities[offset:offset + len(item_rows)])
+                offset += len(item_rows)
+
+
+class ModelHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path != '/health':
+            return self._reply(404, {"error": "not found"})
+        server = self.server
+        batcher = server.batcher
+        self._reply(200, {
+            "status": "ok",
+            "model_path": server.model_path,
+            "model_type": type(batcher.model).__name__,
+            "uptime": time.monotonic() - server.started,
+            "requests": batcher.requests,
+            "batches": batcher.batches,
+            "rows": batcher.rows,
+        })
+
+    def do_POST(self):
+        if self.path != '/predict_proba':
+            return self._reply(404, {"error": "not found"})
+        try:
+            payload = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+            rows = [str(row) for row in payload['rows']]
+        except (ValueError, KeyError, TypeError):
+            return self._reply(400, {"error": "expected {\"rows\": [...]}"})
+        try:
+            probabilities = self.server.batcher.predict_proba(rows)
+        except Exception as e:
+            return self._reply(500, {"error": str(e)})
+        self._reply(200, {"probabilities": probabilities.tolist()})
+
+    def _reply(self, status, body):
+        raw = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(raw)))
+        self.end_headers()
+        self.wfile.write(raw)
+
+    def log_message(self, format, *args):
+        pass
+
+
+# Prefer the compact artifact (model_artifact.py) when it was exported from this pickle
+def load_model(path, artifact_dir=None):
+    if artifact_dir and os.path.exists(os.path.join(artifact_dir, 'meta.json')):
+        artifact = CompactModel(artifact_dir)
+        if artifact.version == model_version(path):
+            return artifact
+        logger.warning("Model artifact is stale, loading pickle", extra={"artifact": artifact_dir, "model": path})
+    with open(path, 'rb') as f:
+        return pickle.load(f)
+
+
+def make_server(model_path, host='127.0.0.1', port=8601, window=0.005, max_rows=512, artifact_dir=None):
+    server = ThreadingHTTPServer((host, port), ModelHandler)
+    server.daemon_threads = True
+    server.model_path = model_path
+    server.started = time.monotonic()
+    server.batcher = MicroBatcher(load_model(model_path, artifact_dir), window=window, max_rows=max_rows)
+    return server
+
+
+class ModelClient:
+    """Drop-in for the sklearn pipeline's predict_proba that calls the model server.
+
+    If the server can't be reached the model is loaded in-process from
+    ``fallback_path`` so prescriptions can still be scored.
+    """
+
+    def __init__(self, url, timeout=10, fallback_path=None, fallback_artifact_dir=None):
+        self.url = url.rstrip('/')
+        self.timeout = timeout
+        self.fallback_path = fallback_path
+        self.fallback_artifact_dir = fallback_artifact_dir
+        self._fallback = None
+        self._lock = threading.Lock()
+        self.session = requests.Session()
+
+    def predict_proba(self, rows):
+        try:
+            response = self.session.post(f"{self.url}/predict_proba", json={"rows": list(rows)}, timeout=self.timeout)
+            response.raise_for_status()
+            return np.asarray(response.json()["probabilities"])
+        except (requests.RequestException, ValueError, KeyError) as e:
+            if not self.fallback_path:
+                raise
+            logger.warning("Model server unavailable, using local model", extra={"error": str(e)})
+            return self._local_model().predict_proba(rows)
+
+    def _local_model(self):
+        with self._lock:
+            if self._fallback is None:
+                self._fallback = load_model(self.fallback_path, self.fallback_artifact_dir)
+            return self._fallback
+
+    def health(self):
+        response = self.session.get(f"{self.url}/health", timeout=self.timeout)
+        response.raise_for_status()
+        return response.json()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--model', default='medication_model.pkl')
+    parser.add_argument('--artifact', default='medication_model', help='compact artifact directory, if exported')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8601)
+    parser.add_argument('--batch-window', type=float, default=5.0, help='micro-batch window in milliseconds')
+    parser.add_argument('--max-batch-rows', type=int, default=512)
+    args = parser.parse_args()
+    server = make_server(args.model, args.host, args.port, args.batch_window / 1000.0, args.max_batch_rows,
+                         args.artifact)
+    print(f"Model server listening on http://{args.host}:{server.server_address[1]}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.shutdown()
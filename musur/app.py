@@ -1,15 +1,19 @@
 from flask import Flask, request, jsonify, render_template
 from models import db, Patient, Doctor, Prescription
+from database import configure_engine, database_url, engine_options
 import ai_model
 
 app = Flask(__name__)
 
 # Configure the database URI (using SQLite for simplicity)
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///e_prescription.db'
+app.config['SQLALCHEMY_DATABASE_URI'] = database_url('sqlite:///e_prescription.db')
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(app.config['SQLALCHEMY_DATABASE_URI'])
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 
 # Initialize the database
 db.init_app(app)
+with app.app_context():
+    configure_engine(db.engine)
 
 
 @app.route('/')
@@ -19,9 +23,15 @@ def home():
 
 @app.route('/predict', methods=['POST'])
 def predict():
-    data = request.get_json()  # Get input data as JSON
+    data = request.get_json(silent=True) or {}  # Get input data as JSON
     diagnosis = data.get('diagnosis')  # Extract the diagnosis
-    medication = ai_model.predict_medication(diagnosis)  # Call the prediction function
+    if not isinstance(diagnosis, str) or not diagnosis.strip():
+        return jsonify({'error': "'diagnosis' is required"}), 400
+    try:
+        # Optional prescription text is checked with NER; without it only the recommended medications come back
+        medication = ai_model.predict_medication(diagnosis, data.get('prescription'))
+    except RuntimeError as e:
+        return jsonify({'error': str(e)}), 503
     return jsonify({'predicted_medication': medication})
 
 
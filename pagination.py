@@ -0,0 +1,58 @@
+import base64
+from datetime import datetime
+
+from sqlalchemy import and_, or_
+
+DEFAULT_PER_PAGE = 50
+MAX_PER_PAGE = 200
+
+
+def encode_cursor(created_at, row_id):
+    raw = f"{created_at.isoformat()}|{row_id}".encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+# Returns (created_at, id) or None for a missing/garbled cursor
+def decode_cursor(cursor, id_type=str):
+    if not cursor:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode('utf-8')
+        created_at, row_id = raw.split('|', 1)
+        return datetime.fromisoformat(created_at), id_type(row_id)
+    except (ValueError, UnicodeDecodeError):
+        return None
+
+
+def per_page_arg(value):
+    try:
+        return max(1, min(MAX_PER_PAGE, int(value)))
+    except (TypeError, ValueError):
+        return DEFAULT_PER_PAGE
+
+
+# Parse a YYYY-MM-DD query argument, ignoring bad input
+def date_arg(value):
+    try:
+        return datetime.strptime(value, '%Y-%m-%d') if value else None
+    except ValueError:
+        return None
+
+
+# Newest-first keyset page over (created_at, id). Returns (items, next_cursor).
+def keyset_page(query, model, cursor=None, per_page=DEFAULT_PER_PAGE):
+    id_type = model.id.type.python_type
+    position = decode_cursor(cursor, id_type)
+    if position is not None:
+        created_at, row_id = position
+        query = query.filter(or_(
+            model.created_at < created_at,
+            and_(model.created_at == created_at, model.id < row_id),
+        ))
+    rows = query.order_by(model.created_at.desc(), model.id.desc()).limit(per_page + 1).all()
+    items = rows[:per_page]
+    next_cursor = None
+    if len(rows) > per_page and items:
+        last = items[-1]
+        next_cursor = encode_cursor(last.created_at, last.id)
+    return items, next_cursor
@@ -0,0 +1,213 @@
+import logging
+import os
+import time
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from cache import TTLCache
+from pharmacy_client import CircuitBreaker, PharmacyClient
+
+logger = logging.getLogger(__name__)
+
+API_URL = os.environ.get('PHARMACY_API_URL', "https://osonapteka.uz/api/web/Product/Search")
+REQUEST_TIMEOUT = 5
+RETRY_ATTEMPTS = 3
+# Overall budget for all lookups of one prescription, in seconds
+LOOKUP_DEADLINE = float(os.environ.get('PHARMACY_LOOKUP_DEADLINE', 8))
+MAX_WORKERS = int(os.environ.get('PHARMACY_MAX_WORKERS', 8))
+
+# Shared, bounded pool so one page view can't spawn unlimited threads
+_executor = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix='pharmacy')
+# Stale-entry refreshes get their own small pool so a slow upstream can't starve foreground lookups
+REFRESH_WORKERS = int(os.environ.get('PHARMACY_REFRESH_WORKERS', 2))
+_refresh_executor = ThreadPoolExecutor(max_workers=REFRESH_WORKERS, thread_name_prefix='pharmacy-refresh')
+
+# One pooled client per worker process; the breaker sends traffic straight to mock data while upstream is down
+client = PharmacyClient(
+    API_URL,
+    timeout=REQUEST_TIMEOUT,
+    attempts=RETRY_ATTEMPTS,
+    pool_size=MAX_WORKERS,
+    breaker=CircuitBreaker(
+        failure_threshold=int(os.environ.get('PHARMACY_BREAKER_THRESHOLD', 5)),
+        reset_timeout=float(os.environ.get('PHARMACY_BREAKER_RESET', 30)),
+    ),
+)
+
+# Search results keyed by normalized medication name; failures are cached as None
+search_cache = TTLCache(
+    maxsize=int(os.environ.get('PHARMACY_CACHE_SIZE', 512)),
+    ttl=float(os.environ.get('PHARMACY_CACHE_TTL', 300)),
+    negative_ttl=float(os.environ.get('PHARMACY_CACHE_NEGATIVE_TTL', 30)),
+    stale_ttl=float(os.environ.get('PHARMACY_CACHE_STALE_TTL', 600)),
+    executor=_refresh_executor,
+)
+
+# Expanded mock pharmacy data
+PHARMACIES = [
+    {
+        "name": "Oson Apteka Chilanzar",
+        "address": "Tashkent, Chilanzar",
+        "regionId": 21,
+        "distance": 5.2,
+        "medications": ["Metformin", "Paracetamol", "Парастамик", "Beromed"],
+        "price": 15000
+    },
+    {
+        "name": "Samarqand Apteka",
+        "address": "Samarkand, Center",
+        "regionId": 22,
+        "distance": 10.0,
+        "medications": ["Paracetamol", "Beromed", "Metformin"],
+        "price": 18000
+    },
+    {
+        "name": "Buxoro Apteka",
+        "address": "Bukhara, Center",
+        "regionId": 23,
+        "distance": 15.0,
+        "medications": ["Парастамик", "Metformin"],
+        "price": 17000
+    },
+    {
+        "name": "Andijon Apteka",
+        "address": "Andijan, Center",
+        "regionId": 24,
+        "distance": 12.0,
+        "medications": ["Metformin", "Beromed"],
+        "price": 20000
+    }
+]
+
+
+# Search term for a medication: the catalog spelling when a resolver (med_resolver.py) knows it
+def search_name(medication, resolver=None):
+    return resolver.canonical(medication) if resolver is not None else medication
+
+
+# Whether a mock pharmacy stocks the medication, allowing for spelling variants
+def stocks(pharmacy, medication, resolver=None):
+    name = search_name(medication, resolver)
+    return any(search_name(stocked, resolver) == name for stocked in pharmacy["medications"])
+
+
+# Mock pharmacy data for a single medication
+def mock_pharmacy_data(medication, resolver=None):
+    mock_data = [
+        {
+            "medication": medication,
+            "pharmacy": p,
+            "inStock": True,
+            "price": p["price"]
+        } for p in PHARMACIES if stocks(p, medication, resolver)
+    ]
+    logger.debug("Using mock pharmacy data", extra={"medication": medication, "results": len(mock_data)})
+    return mock_data
+
+
+# Cache key for a medication name
+def normalize_medication(medication):
+    return " ".join(medication.split()).casefold()
+
+
+# Fetch pharmacy data through the cache, falling back to mock data on failure.
+# Concurrent misses for one term share a single API call.
+def fetch_pharmacy_data(medication, deadline=None, resolver=None):
+    term = search_name(medication, resolver)
+    data = search_cache.get_or_load(
+        normalize_medication(term),
+        lambda: client.search(term, deadline),
+        is_negative=lambda value: value is None,
+        background_loader=lambda: client.search(term, time.monotonic() + LOOKUP_DEADLINE),
+        timeout=None if deadline is None else max(0.0, deadline - time.monotonic()),
+    )
+    if data is None:
+        return mock_pharmacy_data(medication, resolver)
+    return data
+
+
+# Look up all medications in parallel; anything not done by the deadline falls back to mock data
+def fetch_all(medications, deadline=LOOKUP_DEADLINE, resolver=None):
+    medications = list(dict.fromkeys(medications))
+    if not medications:
+        return {}
+    deadline_at = time.monotonic() + deadline
+    futures = {med: _executor.submit(fetch_pharmacy_data, med, deadline_at, resolver) for med in medications}
+    wait(futures.values(), timeout=deadline)
+
+    results = {}
+    for med, future in futures.items():
+        if future.done() and future.exception() is None:
+            results[med] = future.result()
+        else:
+            future.cancel()
+            logger.warning("Pharmacy lookup missed the deadline", extra={"medication": med})
+            results[med] = mock_pharmacy_data(med, resolver)
+    return results
+
+
+# Aggregate pharmacy data
+def get_pharmacy_availability(medications, resolver=None):
+    pharmacies = {}
+    fetched = fetch_all(medications, resolver=resolver)
+    for med in medications:
+        results = fetched.get(med, [])
+        for result in results:
+            try:
+                # Handle string results (e.g., API returns list of medication names)
+                if isinstance(result, str):
+                    logger.warning("Unexpected string result from pharmacy API", extra={"medication": med})
+                    # Assume string is medication name, use mock-like structure
+                    for p in PHARMACIES:
+                        if stocks(p, med, resolver):
+                            name = p["name"]
+                            pharmacies[name] = {
+                                "name": name,
+                                "address": p["address"],
+                                "regionId": p["regionId"],
+                                "distance": p["distance"],
+                                "available_meds": [med],
+                                "total_price": p["price"],
+                                "all_meds_available": False,
+                                "link": f"https://osonapteka.uz/search?query={urllib.parse.quote(med)}"
+                            }
+                    continue
+
+                # Handle dictionary results
+                med_name = result.get('medication', med) if isinstance(result, dict) else med
+                pharmacy_info = result.get('pharmacy', {}) if isinstance(result, dict) else {}
+                name = pharmacy_info.get('name', 'Unknown Pharmacy')
+                address = pharmacy_info.get('address', 'Unknown Address')
+                regionId = pharmacy_info.get('regionId', 0)
+                price = pharmacy_info.get('price', 999999)
+                inStock = result.get('inStock', False) if isinstance(result, dict) else True
+
+                if name not in pharmacies:
+                    pharmacies[name] = {
+                        "name": name,
+                        "address": address,
+                        "regionId": regionId,
+                        "distance": pharmacy_info.get('distance', 9999),
+                        "available_meds": [],
+                        "total_price": 0,
+                        "all_meds_available": False,
+                        "link": f"https://osonapteka.uz/search?query={urllib.parse.quote(med)}"
+                    }
+                if inStock:
+                    pharmacies[name]["available_meds"].append(med_name)
+                    pharmacies[name]["total_price"] += price
+            except (KeyError, TypeError) as e:
+                logger.warning("Could not parse pharmacy API result", extra={"medication": med, "error": str(e)})
+                continue
+
+    # Check if all medications are available
+    pharmacy_list = list(pharmacies.values())
+    for p in pharmacy_list:
+        p["all_meds_available"] = ({search_name(m, resolver) for m in p["available_meds"]}
+                                   == {search_name(m, resolver) for m in medications})
+        p["distance"] = float(p["distance"]) if p["distance"] else 9999
+        p["total_price"] = float(p["total_price"]) if p["total_price"] else 999999
+        p["regionId"] = int(p["regionId"]) if p["regionId"] else 0
+
+    logger.debug("Aggregated pharmacies", extra={"pharmacies": len(pharmacy_list)})
+    return pharmacy_list
@@ -0,0 +1,160 @@
+"""Deadline and fallback checks for the pharmacy lookups, against the local stub.
+
+Starts pharmacy_stub.py on a free port, points the shared pharmacy client at
+it and fails if a slow upstream holds ``fetch_all`` past its deadline, if the
+mock fallback isn't used then, if real upstream data isn't returned when the
+stub answers quickly, if concurrent misses for one medication make more than
+one API call, if background refreshes of stale entries delay foreground
+lookups, or if a lookup whose deadline already passed leaves the circuit
+breaker stuck half-open:
+
+    python pharmacy_check.py
+"""
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pharmacy
+from pharmacy_client import CircuitBreaker
+from pharmacy_stub import start_stub_server
+
+MEDICATIONS = ['Metformin', 'Paracetamol', 'Beromed']
+DEADLINE = 0.5
+# Scheduling slack allowed on top of the deadline
+SLACK = 0.25
+
+
+# Wait for lookups still running from an earlier scenario: once every pool worker
+# has reached the barrier, everything queued before it has finished
+def _drain(executor, workers, timeout=10):
+    barrier = threading.Barrier(workers + 1, timeout=timeout)
+    for _ in range(workers):
+        executor.submit(barrier.wait)
+    barrier.wait()
+
+
+# Fresh cache and breaker so scenarios don't see each other's results
+def _reset(url):
+    _drain(pharmacy._executor, pharmacy.MAX_WORKERS)
+    _drain(pharmacy._refresh_executor, pharmacy.REFRESH_WORKERS)
+    pharmacy.client.url = url
+    pharmacy.client.breaker = CircuitBreaker(failure_threshold=5, reset_timeout=30)
+    pharmacy.search_cache.invalidate()
+
+
+def check_slow_upstream(failures):
+    server, url = start_stub_server(latency=DEADLINE * 3)
+    try:
+        _reset(url)
+        started = time.monotonic()
+        results = pharmacy.fetch_all(MEDICATIONS, deadline=DEADLINE)
+        elapsed = time.monotonic() - started
+        if elapsed > DEADLINE + SLACK:
+            failures.append(f"slow upstream: fetch_all took {elapsed:.2f}s (deadline {DEADLINE}s)")
+        for med in MEDICATIONS:
+            if results.get(med) != pharmacy.mock_pharmacy_data(med):
+                failures.append(f"slow upstream: {med} did not fall back to mock data")
+        print(f"slow upstream: {elapsed:.2f}s, {server.request_count} stub requests")
+    finally:
+        server.shutdown()
+
+
+def check_fast_upstream(failures):
+    server, url = start_stub_server(latency=0.01)
+    try:
+        _reset(url)
+        calls_before = pharmacy.client.stats()["calls"]
+        errors_before = pharmacy.client.stats()["errors"]
+        started = time.monotonic()
+        results = pharmacy.fetch_all(MEDICATIONS, deadline=DEADLINE)
+        elapsed = time.monotonic() - started
+        stats = pharmacy.client.stats()
+        if stats["calls"] - calls_before != len(MEDICATIONS) or stats["errors"] != errors_before:
+            failures.append(f"fast upstream: expected {len(MEDICATIONS)} clean API calls, stats {stats}")
+        for med in MEDICATIONS:
+            found, cached, _ = pharmacy.search_cache.get(pharmacy.normalize_medication(med))
+            if not found or cached is None or results.get(med) != cached:
+                failures.append(f"fast upstream: {med} was not served from the API")
+            elif not cached:
+                failures.append(f"fast upstream: {med} returned no results")
+        print(f"fast upstream: {elapsed:.2f}s, {server.request_count} stub requests")
+    finally:
+        server.shutdown()
+
+
+def check_concurrent_misses(failures):
+    server, url = start_stub_server(latency=0.1)
+    try:
+        _reset(url)
+        deadline = time.monotonic() + DEADLINE * 2
+        with ThreadPoolExecutor(max_workers=8) as callers:
+            results = list(callers.map(lambda _: pharmacy.fetch_pharmacy_data('Metformin', deadline), range(8)))
+        if server.request_count != 1:
+            failures.append(f"concurrent misses: {server.request_count} API calls for one medication")
+        if any(result != results[0] for result in results):
+            failures.append("concurrent misses: callers got different results")
+        print(f"concurrent misses: {server.request_count} stub request(s) for 8 callers")
+    finally:
+        server.shutdown()
+
+
+def check_refresh_isolation(failures):
+    server, url = start_stub_server(latency=0.0)
+    try:
+        _reset(url)
+        # More stale entries than foreground workers, each refresh taking half the deadline
+        stale = [f"Stale{i}" for i in range(pharmacy.MAX_WORKERS * 3)]
+        ttl = pharmacy.search_cache.ttl
+        pharmacy.search_cache.ttl = 0
+        try:
+            for med in stale:
+                pharmacy.search_cache.set(pharmacy.normalize_medication(med), [])
+        finally:
+            pharmacy.search_cache.ttl = ttl
+        server.latency = DEADLINE * 0.5
+        for med in stale:
+            pharmacy.fetch_pharmacy_data(med)
+
+        errors_before = pharmacy.client.stats()["errors"]
+        pharmacy.fetch_all(MEDICATIONS, deadline=DEADLINE)
+        missing = [med for med in MEDICATIONS
+                   if pharmacy.search_cache.get(pharmacy.normalize_medication(med))[1] is None]
+        if missing or pharmacy.client.stats()["errors"] != errors_before:
+            failures.append(f"refresh isolation: foreground lookups fell back while refreshing: {missing}")
+        print(f"refresh isolation: {len(stale)} refreshes queued, foreground served from the API: {not missing}")
+    finally:
+        server.shutdown()
+
+
+def check_breaker_expired_deadline(failures):
+    server, url = start_stub_server(latency=0.0)
+    try:
+        _reset(url)
+        breaker = pharmacy.client.breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.05)
+        breaker.record_failure()
+        time.sleep(breaker.reset_timeout * 2)
+        # Due for a half-open probe, but the caller is already out of time
+        pharmacy.client.search('Metformin', deadline=time.monotonic() - 1)
+        data = pharmacy.client.search('Metformin', deadline=time.monotonic() + DEADLINE)
+        if data is None or breaker.state != CircuitBreaker.CLOSED:
+            failures.append(f"breaker: stuck {breaker.state} after a lookup with an expired deadline")
+        print(f"breaker after expired-deadline lookup: {breaker.state}")
+    finally:
+        server.shutdown()
+
+
+def main():
+    failures = []
+    for check in (check_slow_upstream, check_fast_upstream, check_concurrent_misses, check_refresh_isolation,
+                  check_breaker_expired_deadline):
+        check(failures)
+    if failures:
+        print("\n".join(failures))
+        return 1
+    print("All pharmacy checks passed")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,167 @@
+import logging
+import random
+import threading
+import time
+from collections import deque
+
+import requests
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+
+class CircuitBreaker:
+    """Consecutive-failure circuit breaker.
+
+    closed -> open after ``failure_threshold`` failures in a row; open ->
+    half_open after ``reset_timeout`` seconds, when a single probe is let
+    through; the probe's outcome closes or re-opens the circuit.
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, failure_threshold=5, reset_timeout=30):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+
+    def allow_request(self):
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+                self._probe_in_flight = False
+            if self.state == self.HALF_OPEN and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+            self._probe_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+            self._probe_in_flight = False
+
+
+class PharmacyClient:
+    """osonapteka.uz Product/Search client with a pooled session, jittered
+    exponential backoff, a circuit breaker and per-call metrics."""
+
+    def __init__(self, url, timeout=5, attempts=3, backoff_base=0.25, backoff_max=2.0,
+                 pool_size=8, breaker=None, verify=False):
+        self.url = url
+        self.timeout = timeout
+        self.attempts = attempts
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.breaker = breaker or CircuitBreaker()
+        self.session = requests.Session()
+        self.session.verify = verify
+        self.session.headers.update({'Content-Type': 'application/json'})
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+        self._lock = threading.Lock()
+        self._latencies = deque(maxlen=1000)
+        self.calls = 0
+        self.errors = 0
+        self.short_circuited = 0
+        self.total_latency = 0.0
+
+    # Full-jitter exponential backoff for the given attempt number
+    def backoff(self, attempt):
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    def _record(self, latency, ok):
+        with self._lock:
+            self.calls += 1
+            self.total_latency += latency
+            self._latencies.append(latency)
+            if not ok:
+                self.errors += 1
+
+    # Returns the result list, or None when upstream failed or the circuit is open.
+    # Retries stop once the deadline (time.monotonic) has passed.
+    def search(self, medication, deadline=None):
+        payload = {
+            "pageSize": 20,
+            "page": 1,
+            "searchText": medication,
+            "showOnlyExistonStore": True
+        }
+        for attempt in range(self.attempts):
+            # Deadline first: allow_request() may hand out the half-open probe, which
+            # must then be settled by record_success/record_failure
+            timeout = self.timeout
+            if deadline is not None:
+                timeout = min(timeout, deadline - time.monotonic())
+                if timeout <= 0:
+                    break
+            if not self.breaker.allow_request():
+                with self._lock:
+                    self.short_circuited += 1
+                logger.debug("Circuit open, skipping pharmacy API",
+                             extra={"state": self.breaker.state, "medication": medication})
+                return None
+            started = time.monotonic()
+            try:
+                response = self.session.post(self.url, json=payload, timeout=timeout)
+                response.raise_for_status()
+                raw_data = response.json()
+            except (requests.RequestException, ValueError) as e:
+                self._record(time.monotonic() - started, ok=False)
+                self.breaker.record_failure()
+                logger.warning("Pharmacy API error", extra={"medication": medication, "attempt": attempt + 1,
+                                                            "error": str(e)})
+                if attempt + 1 < self.attempts:
+                    delay = self.backoff(attempt)
+                    if deadline is not None:
+                        delay = min(delay, max(0.0, deadline - time.monotonic()))
+                    time.sleep(delay)
+                continue
+            except BaseException:
+                # Anything else still settles a half-open probe
+                self.breaker.record_failure()
+                raise
+            self._record(time.monotonic() - started, ok=True)
+            self.breaker.record_success()
+            data = raw_data.get('data', []) if isinstance(raw_data, dict) else []
+            logger.debug("Pharmacy API success", extra={"medication": medication, "results": len(data)})
+            return data
+        return None
+
+    def stats(self):
+        with self._lock:
+            latencies = sorted(self._latencies)
+            calls = self.calls
+
+            def percentile(q):
+                return latencies[min(len(latencies) - 1, int(q * len(latencies)))] if latencies else 0.0
+
+            return {
+                "calls": calls,
+                "errors": self.errors,
+                "error_rate": self.errors / calls if calls else 0.0,
+                "short_circuited": self.short_circuited,
+                "avg_latency": self.total_latency / calls if calls else 0.0,
+                "p50_latency": percentile(0.50),
+                "p95_latency": percentile(0.95),
+                "breaker_state": self.breaker.state,
+                "consecutive_failures": self.breaker.failures,
+            }
@@ -0,0 +1,92 @@
+"""Local stand-in for the osonapteka.uz Product/Search API.
+
+Run it and point the app at it:
+
+    python pharmacy_stub.py --port 8765 --latency 0.2 --failure-rate 0.1
+    PHARMACY_API_URL=http://127.0.0.1:8765/api/web/Product/Search python app.py
+
+pharmacy_check.py runs the lookup deadline/fallback checks against it.
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from pharmacy import PHARMACIES
+
+SEARCH_PATH = "/api/web/Product/Search"
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        server = self.server
+        length = int(self.headers.get('Content-Length', 0))
+        try:
+            payload = json.loads(self.rfile.read(length) or b'{}')
+        except ValueError:
+            payload = {}
+        server.request_count += 1
+
+        if server.latency:
+            time.sleep(server.latency)
+        if self.path != SEARCH_PATH:
+            return self._reply(404, {"error": "not found"})
+        if server.failure_rate and server.random.random() < server.failure_rate:
+            return self._reply(503, {"error": "stub failure"})
+
+        medication = payload.get("searchText", "")
+        data = [
+            {
+                "medication": medication,
+                "pharmacy": p,
+                "inStock": True,
+                "price": p["price"]
+            } for p in PHARMACIES if medication in p["medications"]
+        ]
+        self._reply(200, {"data": data})
+
+    def _reply(self, status, body):
+        raw = json.dumps(body, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(raw)))
+        self.end_headers()
+        try:
+            self.wfile.write(raw)
+        except (BrokenPipeError, ConnectionResetError):
+            # Client gave up (deadline hit) before the stub answered
+            pass
+
+    def log_message(self, format, *args):
+        pass
+
+
+# Start a stub server in a background thread; returns (server, url)
+def start_stub_server(port=0, latency=0.0, failure_rate=0.0, seed=None):
+    server = ThreadingHTTPServer(('127.0.0.1', port), StubHandler)
+    server.daemon_threads = True
+    server.latency = latency
+    server.failure_rate = failure_rate
+    server.random = random.Random(seed)
+    server.request_count = 0
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}{SEARCH_PATH}"
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds to wait before answering')
+    parser.add_argument('--failure-rate', type=float, default=0.0, help='fraction of requests answered with 503')
+    parser.add_argument('--seed', type=int, default=None)
+    args = parser.parse_args()
+    server, url = start_stub_server(args.port, args.latency, args.failure_rate, args.seed)
+    print(f"Pharmacy stub listening on {url}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -0,0 +1,126 @@
+import hashlib
+import io
+import logging
+import os
+import threading
+
+import qrcode
+import qrcode.image.svg
+
+from cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+MIMETYPES = {
+    'png': 'image/png',
+    'svg': 'image/svg+xml',
+}
+
+
+# Render a QR code for data as PNG or SVG bytes
+def render_qr(data, fmt='png'):
+    qr = qrcode.QRCode(version=1, box_size=10, border=5)
+    qr.add_data(data)
+    qr.make(fit=True)
+    img_io = io.BytesIO()
+    if fmt == 'svg':
+        # Vector path output skips PIL rasterizing and PNG compression
+        qr.make_image(image_factory=qrcode.image.svg.SvgPathImage).save(img_io)
+    else:
+        qr.make_image(fill='black', back_color='white').save(img_io, 'PNG')
+    return img_io.getvalue()
+
+
+class QRArtifactCache:
+    """QR images for prescription links, kept in a bounded in-memory LRU and
+    persisted to ``directory`` so workers and restarts reuse them.
+
+    Entries are keyed by (prescription id, base URL, format). Only links on a
+    configured base URL are written to disk, so varying Host headers can't
+    fill it; the directory holds at most about ``max_disk_items`` files, the
+    oldest being removed first. The output depends only on the encoded URL,
+    so entries never expire and the content hash doubles as a strong ETag.
+    """
+
+    def __init__(self, directory, max_items=1024, max_disk_items=100000):
+        self.directory = directory
+        self.max_disk_items = max_disk_items
+        self._memory = TTLCache(maxsize=max_items, ttl=float('inf'))
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self._disk_items = self._count_files()
+
+    @staticmethod
+    def key(prescription_id, base_url, fmt):
+        return hashlib.sha256(f"{fmt}|{base_url}|{prescription_id}".encode('utf-8')).hexdigest()
+
+    def _path(self, key, fmt):
+        return os.path.join(self.directory, f"{key}.{fmt}")
+
+    def _count_files(self):
+        with os.scandir(self.directory) as entries:
+            return sum(1 for entry in entries if entry.name.endswith(tuple(f".{fmt}" for fmt in MIMETYPES)))
+
+    def _load_or_render(self, key, data, fmt, persist):
+        path = self._path(key, fmt)
+        try:
+            if not persist:
+                raise FileNotFoundError(path)
+            with open(path, 'rb') as f:
+                content = f.read()
+        except OSError:
+            content = render_qr(data, fmt)
+            if persist:
+                self._persist(path, content)
+        return content, hashlib.sha256(content).hexdigest()[:32]
+
+    def _persist(self, path, content):
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, 'wb') as f:
+                f.write(content)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning("Could not persist QR artifact", extra={"artifact": path, "error": str(e)})
+            return
+        with self._lock:
+            self._disk_items += 1
+            if self._disk_items <= self.max_disk_items:
+                return
+            self._disk_items = self._prune()
+
+    # Remove the oldest files down to 90% of max_disk_items; returns how many are left.
+    # Each worker counts its own writes, so the directory is rescanned before pruning.
+    def _prune(self):
+        with os.scandir(self.directory) as entries:
+            files = [(entry.stat().st_mtime, entry.path) for entry in entries
+                     if entry.name.endswith(tuple(f".{fmt}" for fmt in MIMETYPES))]
+        keep = int(self.max_disk_items * 0.9)
+        if len(files) <= self.max_disk_items:
+            return len(files)
+        files.sort()
+        removed = 0
+        for _, path in files[:len(files) - keep]:
+            try:
+                os.remove(path)
+                removed += 1
+            except FileNotFoundError:
+                pass
+        logger.info("Pruned QR artifacts", extra={"removed": removed, "directory": self.directory})
+        return len(files) - removed
+
+    # Returns (content bytes, etag) for the QR code of a prescription's link (base_url + path).
+    # persist=False keeps it in memory only, for links on an unconfigured (request) host.
+    def get(self, prescription_id, base_url, path, fmt='png', persist=True):
+        if fmt not in MIMETYPES:
+            raise ValueError(f"Unsupported QR format: {fmt}")
+        key = self.key(prescription_id, base_url, fmt)
+        return self._memory.get_or_load(
+            key, lambda: self._load_or_render(key, base_url + path, fmt, persist))
+
+    def stats(self):
+        stats = self._memory.stats()
+        with self._lock:
+            stats["disk_items"] = self._disk_items
+        stats["max_disk_items"] = self.max_disk_items
+        return stats
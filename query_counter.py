@@ -0,0 +1,129 @@
+"""Query-count harness for listing pages.
+
+QueryCounter / assert_max_queries count the SQL statements a block of code
+issues on the current thread. Running this module seeds a scratch database
+at two sizes and fails if any listing page goes over its query budget or
+issues more queries as rows are added (an N+1):
+
+    python query_counter.py
+"""
+import os
+import sys
+import tempfile
+import threading
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+from sqlalchemy import event
+
+# Max statements per page, independent of how many rows are listed
+PAGE_BUDGETS = {
+    '/admin': 10,
+    '/admin/audit_logs': 8,
+    '/prescriptions': 6,
+    '/doctor': 6,
+}
+
+
+class QueryCounter:
+    """Counts statements executed through ``engine`` by the current thread."""
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.statements = []
+        self._thread = None
+
+    def _on_execute(self, conn, cursor, statement, parameters, context, executemany):
+        if threading.get_ident() == self._thread:
+            self.statements.append(statement)
+
+    @property
+    def count(self):
+        return len(self.statements)
+
+    def __enter__(self):
+        self._thread = threading.get_ident()
+        event.listen(self.engine, 'before_cursor_execute', self._on_execute)
+        return self
+
+    def __exit__(self, *exc):
+        event.remove(self.engine, 'before_cursor_execute', self._on_execute)
+        return False
+
+
+@contextmanager
+def assert_max_queries(engine, limit, label='block'):
+    with QueryCounter(engine) as counter:
+        yield counter
+    if counter.count > limit:
+        listing = "\n".join(f"  {i + 1}. {sql.splitlines()[0]}" for i, sql in enumerate(counter.statements))
+        raise AssertionError(f"{label} issued {counter.count} queries (limit {limit}):\n{listing}")
+
+
+def _seed(app_module, prescriptions, audit_rows):
+    db, User, Prescription, AuditLog = app_module.db, app_module.User, app_module.Prescription, app_module.AuditLog
+    doctors = User.query.filter_by(role='doctor').all()
+    now = datetime.utcnow()
+    db.session.add_all(Prescription(
+        id=str(uuid.uuid4()), patient_id=str(app_module.patient_ids.next()),
+        doctor_id=doctors[i % len(doctors)].id, diagnosis='Astma', medications='Budesonid,Salbutamol',
+        ai_score=80, correct_meds='Budesonid,Salbutamol', incorrect_meds='', essential_meds='Budesonid,Salbutamol',
+        non_essential_meds='', confidence_scores='Budesonid:0.80,Salbutamol:0.80',
+        created_at=now - timedelta(minutes=i),
+    ) for i in range(prescriptions))
+    db.session.add_all(AuditLog(user_id=doctors[i % len(doctors)].id, action='Seed', details=str(i),
+                                created_at=now - timedelta(seconds=i)) for i in range(audit_rows))
+    db.session.commit()
+
+
+def main():
+    workdir = tempfile.mkdtemp(prefix='eprescription-queries-')
+    os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(workdir, 'queries.db')
+    os.environ.setdefault('AUDIT_MODE', 'async')
+    import bcrypt
+    import app as app_module
+
+    app, db, User = app_module.app, app_module.db, app_module.User
+    password = bcrypt.hashpw(b'check', bcrypt.gensalt(4))
+    with app.app_context():
+        db.session.add_all([User(username=f'doctor{i}', password=password, role='doctor') for i in range(5)])
+        db.session.add(User(username='admin', password=password, role='admin'))
+        db.session.commit()
+
+    failures = []
+    counts = {}
+    for size in (5, 100):
+        with app.app_context():
+            _seed(app_module, size, size)
+            engine = db.engine
+        app_module.audit_writer.flush()
+        for path, limit in PAGE_BUDGETS.items():
+            client = app.test_client()
+            user = 'doctor0' if path in ('/prescriptions', '/doctor') else 'admin'
+            client.post('/login', data={'username': user, 'password': 'check'})
+            # Warm per-worker caches first, so only the steady-state queries are counted
+            client.get(path)
+            try:
+                with assert_max_queries(engine, limit, f"GET {path} ({size} rows)") as counter:
+                    response = client.get(path)
+                counts.setdefault(path, []).append(counter.count)
+                if response.status_code != 200:
+                    failures.append(f"GET {path} returned {response.status_code}")
+            except AssertionError as e:
+                failures.append(str(e))
+
+    for path, seen in counts.items():
+        print(f"{path}: {seen} queries")
+        if len(set(seen)) > 1:
+            failures.append(f"GET {path} query count grows with rows: {seen}")
+    app_module.audit_writer.close()
+    if failures:
+        print("\n".join(failures))
+        return 1
+    print("All pages within query budget")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
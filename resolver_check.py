@@ -0,0 +1,85 @@
+"""Regression checks for medication name resolution (med_resolver.py).
+
+Builds the resolver the app uses (diseases.csv catalog + medication_aliases.csv)
+and fails if a spelling variant doesn't resolve to its catalog name, if a
+different drug that shares a stem with a catalog name resolves to it, or if a
+lookup averages over the time budget:
+
+    python resolver_check.py
+"""
+import sys
+import time
+
+from knowledge_base import DiagnosisKnowledgeBase
+from med_resolver import MedicationResolver, load_aliases
+
+# Spelling variant -> catalog name it must resolve to
+SAME_DRUG = {
+    'metformin': 'Metformin',
+    'METFORMIN': 'Metformin',
+    'Paracetamol': 'Paratsetamol',
+    'Парацетамол': 'Paratsetamol',
+    'Парастамик': 'Paratsetamol',
+    'Amoxicillin': 'Amoksitsillin',
+    'Азитромицин': 'Azitromitsin',
+    'Azithromycin': 'Azitromitsin',
+    'Omeprazole': 'Omeprazol',
+    'Fluoxetine': 'Fluoksetin',
+    'Rifampicin': 'Rifampitsin',
+    'Nitroglycerin': 'Nitrogliserin',
+    'Budeosonid': 'Budesonid',
+    'Metfromin': 'Metformin',
+    'Salbutamo': 'Salbutamol',
+    'Losartn': 'Losartan',
+    'Tamiflo': 'Tamiflu',
+    'Paracetomol': 'Paratsetamol',
+    'Sertaline': 'Sertralin',
+    'Isoniazd': 'Isoniazid',
+}
+# Different drugs (not in the catalog) -> the catalog name they look like; must not resolve
+DISTINCT_DRUG = {
+    'Eritromitsin': 'Azitromitsin',
+    'Klaritromitsin': 'Azitromitsin',
+    'Valsartan': 'Losartan',
+    'Ampitsillin': 'Amoksitsillin',
+    'Oksatsillin': 'Amoksitsillin',
+    'Esomeprazol': 'Omeprazol',
+    'Nizatidin': 'Ranitidin',
+    'Penitsillamin': 'Penitsillin',
+}
+# Average microseconds per resolve() over the checked names
+LOOKUP_BUDGET_US = 500
+
+
+def main():
+    knowledge_base = DiagnosisKnowledgeBase('diseases.csv')
+    resolver = MedicationResolver(knowledge_base.medications(), aliases=load_aliases('medication_aliases.csv'))
+    failures = []
+    for query, expected in SAME_DRUG.items():
+        got = resolver.match(query)
+        if got != expected:
+            failures.append(f"{query!r} resolved to {got!r}, expected {expected!r}: {resolver.resolve(query, k=2)}")
+
+    for query, lookalike in DISTINCT_DRUG.items():
+        got = resolver.match(query)
+        if got is not None:
+            failures.append(f"{query!r} is not {lookalike!r} but resolved to {got!r}: {resolver.resolve(query, k=2)}")
+
+    queries = (list(SAME_DRUG) + list(DISTINCT_DRUG)) * 200
+    started = time.perf_counter()
+    for query in queries:
+        resolver.resolve(query)
+    per_lookup = (time.perf_counter() - started) / len(queries) * 1e6
+    print(f"{len(SAME_DRUG)} variants and {len(DISTINCT_DRUG)} distinct drugs checked, {per_lookup:.0f}us per lookup")
+    if per_lookup > LOOKUP_BUDGET_US:
+        failures.append(f"lookup takes {per_lookup:.0f}us (budget {LOOKUP_BUDGET_US}us)")
+
+    if failures:
+        print("\n".join(failures))
+        return 1
+    print("All resolver checks passed")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
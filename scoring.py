@@ -0,0 +1,72 @@
+import numpy as np
+
+# Dori to'g'ri deb hisoblanadigan minimal ishonch darajasi
+CONFIDENCE_THRESHOLD = 0.7
+
+
+# Build the model input text for one diagnosis/medication pair
+def feature_text(diagnosis, symptoms, medication):
+    return f"{diagnosis} {symptoms} {medication}"
+
+
+# Catalog spelling of a medication name, if a resolver (med_resolver.py) is given
+def canonical(medication, resolver=None):
+    return resolver.canonical(medication) if resolver is not None else medication
+
+
+# Score many (diagnosis, symptoms, medications) requests with a single predict_proba call.
+# Pairs found in the precomputed confidence matrix skip the model entirely.
+# Results stay keyed by the names as written; the model sees the catalog spelling.
+def score_batch(model, requests, matrix=None, resolver=None):
+    results = []
+    rows = []
+    pending = []
+    for diagnosis, symptoms, medications in requests:
+        result = {}
+        for med in medications:
+            name = canonical(med, resolver)
+            prob = matrix.lookup(diagnosis, symptoms, name) if matrix is not None else None
+            if prob is None:
+                rows.append(feature_text(diagnosis, symptoms, name))
+                pending.append((result, med))
+            result[med] = prob
+        results.append(result)
+
+    if rows:
+        probabilities = np.asarray(model.predict_proba(rows))[:, 1]
+        for (result, med), prob in zip(pending, probabilities):
+            result[med] = float(prob)
+    return results
+
+
+# Score all medications of one prescription in one call
+def score_medications(model, diagnosis, symptoms, medications, matrix=None, resolver=None):
+    return score_batch(model, [(diagnosis, symptoms, medications)], matrix, resolver)[0]
+
+
+# Split medications into correct/incorrect and compute the AI score
+def evaluate(medications, recommended_meds, confidence_dict, resolver=None):
+    correct_meds = []
+    incorrect_meds = []
+    confidence_scores = []
+    recommended = {canonical(med, resolver) for med in recommended_meds}
+    for med in medications:
+        is_correct_prob = confidence_dict[med]
+        if canonical(med, resolver) in recommended or is_correct_prob > CONFIDENCE_THRESHOLD:
+            correct_meds.append(med)
+            confidence_scores.append(is_correct_prob)
+        else:
+            incorrect_meds.append(med)
+
+    ai_score = int((len(correct_meds) / len(medications)) * 100) if medications else 0
+    if confidence_scores:
+        ai_score = min(ai_score, int(sum(confidence_scores) / len(confidence_scores) * 100))
+
+    return {
+        "ai_score": ai_score,
+        "correct_meds": correct_meds,
+        "incorrect_meds": incorrect_meds,
+        "essential_meds": list(recommended_meds),
+        "non_essential_meds": [med for med in medications if canonical(med, resolver) not in recommended],
+        "confidence": confidence_dict,
+    }
@@ -0,0 +1,67 @@
+import os
+import threading
+
+from sqlalchemy import text
+
+
+class SequenceAllocator:
+    """Hands out increasing integers from a named row in the id_sequence table.
+
+    Each call to the database atomically bumps the counter by ``block_size``
+    and reserves that block for this process, so most ``next()`` calls never
+    touch the database. Ids are unique across workers; a restarted worker
+    leaves a gap of at most one unused block. ``advance()`` moves the
+    sequence past ids assigned elsewhere, e.g. imported ones.
+    """
+
+    def __init__(self, db, name, block_size=1):
+        self.db = db
+        self.name = name
+        self.block_size = max(1, int(block_size))
+        self._lock = threading.Lock()
+        self._next = 1
+        self._hi = 0
+        self._floor = 0
+        self._pid = os.getpid()
+
+    def next(self):
+        with self._lock:
+            if self._pid != os.getpid():
+                # Forked worker: the parent's block is not ours to use
+                self._pid = os.getpid()
+                self._next, self._hi = 1, 0
+            if self._next > self._hi:
+                self._reserve()
+            value = self._next
+            self._next += 1
+            return value
+
+    # Never hand out ids up to ``value`` from this process; with ``connection`` (a connection
+    # or session) the stored value is moved too, inside the caller's transaction
+    def advance(self, value, connection=None):
+        with self._lock:
+            self._floor = max(self._floor, value)
+            self._next = max(self._next, value + 1)
+        if connection is not None:
+            params = {"name": self.name, "value": value}
+            self._ensure_row(connection, params)
+            connection.execute(text("UPDATE id_sequence SET value = :value WHERE name = :name AND value < :value"),
+                               params)
+
+    def _ensure_row(self, conn, params):
+        conn.execute(text(
+            "INSERT INTO id_sequence (name, value) SELECT :name, 0 "
+            "WHERE NOT EXISTS (SELECT 1 FROM id_sequence WHERE name = :name)"
+        ), params)
+
+    def _reserve(self):
+        params = {"name": self.name, "n": self.block_size, "floor": self._floor}
+        with self.db.engine.begin() as conn:
+            self._ensure_row(conn, params)
+            conn.execute(text(
+                "UPDATE id_sequence SET value = CASE WHEN value < :floor THEN :floor ELSE value END + :n "
+                "WHERE name = :name"
+            ), params)
+            hi = conn.execute(text("SELECT value FROM id_sequence WHERE name = :name"), params).scalar_one()
+        self._next = hi - self.block_size + 1
+        self._hi = hi
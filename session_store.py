@@ -0,0 +1,202 @@
+"""Server-side sessions shared by every worker.
+
+The cookie carries only a signed random session id. Session data lives in
+the database (``user_session`` table, the default) or in Redis when
+SESSION_REDIS_URL is set, so any worker can serve any request and logging
+out deletes the session everywhere.
+
+The signing key must be the same in all workers: SECRET_KEY from the
+environment, or one generated once and kept in the instance folder
+(``persistent_secret_key``).
+"""
+import json
+import os
+import secrets
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+
+from flask.sessions import SessionInterface, SessionMixin
+from itsdangerous import BadSignature, Signer
+from sqlalchemy import Column, DateTime, MetaData, String, Table, Text, delete, insert, select, update
+from werkzeug.datastructures import CallbackDict
+
+
+# Read the key file, creating it atomically the first time so concurrent workers agree: the key
+# is written to a temp file and linked into place, so the file never exists without its key
+def persistent_secret_key(path):
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    if not os.path.exists(path):
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.secret_key-')
+        try:
+            with os.fdopen(fd, 'w') as f:
+                f.write(secrets.token_hex(32))
+                f.flush()
+                os.fsync(f.fileno())
+            try:
+                os.link(tmp_path, path)
+            except FileExistsError:
+                pass  # Another worker won the race; use its key
+        finally:
+            os.unlink(tmp_path)
+    with open(path) as f:
+        key = f.read().strip()
+    if not key:
+        raise RuntimeError(f"Secret key file {path} is empty")
+    return key
+
+
+class ServerSession(CallbackDict, SessionMixin):
+    def __init__(self, initial=None, sid=None, new=False):
+        def on_update(self):
+            self.modified = True
+
+        super().__init__(initial, on_update)
+        self.sid = sid
+        self.new = new
+        self.modified = False
+        self.replaced_sid = None
+
+    # New id for the same data (call on login, so a pre-login session id can't be reused)
+    def regenerate(self):
+        if not self.new and self.replaced_sid is None:
+            self.replaced_sid = self.sid
+        self.sid = secrets.token_urlsafe(32)
+        self.new = True
+        self.modified = True
+
+
+class SQLSessionStore:
+    """Sessions in a table of the app database (SQLite or PostgreSQL)."""
+
+    def __init__(self, engine, table_name='user_session', purge_interval=600):
+        self.engine = engine
+        self.purge_interval = purge_interval
+        self._next_purge = time.monotonic() + purge_interval
+        self._lock = threading.Lock()
+        self.table = Table(
+            table_name, MetaData(),
+            Column('id', String(64), primary_key=True),
+            Column('data', Text, nullable=False),
+            Column('expires_at', DateTime, nullable=False, index=True),
+        )
+        self.table.create(engine, checkfirst=True)
+
+    # Returns (data, expires_at) or None if missing or expired
+    def load(self, sid):
+        with self.engine.connect() as conn:
+            row = conn.execute(select(self.table.c.data, self.table.c.expires_at)
+                               .where(self.table.c.id == sid)).first()
+        if row is None or row.expires_at <= datetime.utcnow():
+            return None
+        return json.loads(row.data), row.expires_at
+
+    def save(self, sid, data, expires_at):
+        values = {"data": json.dumps(data), "expires_at": expires_at}
+        with self.engine.begin() as conn:
+            if conn.execute(update(self.table).where(self.table.c.id == sid).values(**values)).rowcount == 0:
+                conn.execute(insert(self.table).values(id=sid, **values))
+            # Expired rows are cleared every purge_interval seconds instead of by a separate job
+            if self._purge_due():
+                conn.execute(delete(self.table).where(self.table.c.expires_at <= datetime.utcnow()))
+
+    def _purge_due(self):
+        now = time.monotonic()
+        with self._lock:
+            if now < self._next_purge:
+                return False
+            self._next_purge = now + self.purge_interval
+            return True
+
+    def delete(self, sid):
+        with self.engine.begin() as conn:
+            conn.execute(delete(self.table).where(self.table.c.id == sid))
+
+
+class RedisSessionStore:
+    """Sessions in Redis (or a Redis-compatible server), expired by Redis itself."""
+
+    def __init__(self, url, prefix='session:'):
+        import redis
+
+        self.client = redis.Redis.from_url(url)
+        self.prefix = prefix
+
+    def load(self, sid):
+        pipe = self.client.pipeline()
+        pipe.get(self.prefix + sid)
+        pipe.pttl(self.prefix + sid)
+        raw, ttl_ms = pipe.execute()
+        if raw is None or ttl_ms is None or ttl_ms < 0:
+            return None
+        return json.loads(raw), datetime.utcnow() + timedelta(milliseconds=ttl_ms)
+
+    def save(self, sid, data, expires_at):
+        ttl_ms = max(1, int((expires_at - datetime.utcnow()).total_seconds() * 1000))
+        self.client.set(self.prefix + sid, json.dumps(data), px=ttl_ms)
+
+    def delete(self, sid):
+        self.client.delete(self.prefix + sid)
+
+
+class ServerSessionInterface(SessionInterface):
+    """Flask session interface backed by a session store.
+
+    Sessions expire after ``lifetime`` of inactivity; the expiry is pushed
+    back only once less than half of it is left, so most requests don't
+    write to the store.
+    """
+
+    serializer = None
+
+    def __init__(self, store, lifetime=timedelta(hours=12)):
+        self.store = store
+        self.lifetime = lifetime
+
+    def _signer(self, app):
+        return Signer(app.secret_key, salt='server-session')
+
+    def open_session(self, app, request):
+        cookie = request.cookies.get(self.get_cookie_name(app))
+        if cookie:
+            try:
+                sid = self._signer(app).unsign(cookie).decode('ascii')
+            except BadSignature:
+                sid = None
+            loaded = self.store.load(sid) if sid else None
+            if loaded is not None:
+                data, expires_at = loaded
+                session = ServerSession(data, sid=sid)
+                session.expires_at = expires_at
+                return session
+        session = ServerSession(sid=secrets.token_urlsafe(32), new=True)
+        session.expires_at = None
+        return session
+
+    def save_session(self, app, session, response):
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+        if session.replaced_sid is not None:
+            self.store.delete(session.replaced_sid)
+        if not session:
+            if session.modified and not session.new:
+                self.store.delete(session.sid)
+                response.delete_cookie(name, domain=domain, path=path)
+            return
+
+        now = datetime.utcnow()
+        renew = session.expires_at is None or session.expires_at - now < self.lifetime / 2
+        if not (session.modified or renew):
+            return
+        expires_at = now + self.lifetime
+        self.store.save(session.sid, dict(session), expires_at)
+        if session.new or renew:
+            response.set_cookie(
+                name, self._signer(app).sign(session.sid.encode('ascii')).decode('ascii'),
+                expires=expires_at if session.permanent else None,
+                httponly=self.get_cookie_httponly(app), secure=self.get_cookie_secure(app),
+                samesite=self.get_cookie_samesite(app), domain=domain, path=path,
+            )
@@ -1,40 +1,102 @@
-import pandas as pd
+import argparse
 import pickle
-from sklearn.feature_extraction.text import TfidfVectorizer
+
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+from sklearn.feature_extraction.text import CountVectorizer, TfidfVectorizer
 from sklearn.ensemble import RandomForestClassifier
 from sklearn.model_selection import train_test_split
 from sklearn.pipeline import Pipeline
+from model_artifact import export_artifact, model_version
+from confidence_matrix import build_matrix
+
+
+# Every medication mentioned in the catalog, sorted so runs are reproducible
+def medication_vocabulary(df):
+    meds = df['Tavsiya etilgan dorilar'].str.split(',').explode().str.strip()
+    return np.array(sorted(set(meds.dropna()) - {''}), dtype=object)
+
+
+# Boolean (diagnosis row x medication) mask of recommended pairs
+def label_matrix(df, meds):
+    exploded = df['Tavsiya etilgan dorilar'].reset_index(drop=True).str.split(',').explode().str.strip()
+    columns = pd.Index(meds).get_indexer(exploded.to_numpy())
+    valid = columns >= 0
+    mask = np.zeros((len(df), len(meds)), dtype=bool)
+    mask[exploded.index.to_numpy()[valid], columns[valid]] = True
+    return mask
+
+
+# Yield (texts, labels) for the diagnosis x medication cross-join, chunk_size diagnoses at a time
+def iter_training_chunks(df, meds=None, chunk_size=None):
+    meds = medication_vocabulary(df) if meds is None else meds
+    features = (df['Kasallik nomi'] + " " + df['Belgilar']).to_numpy(dtype=object)
+    mask = label_matrix(df, meds)
+    chunk_size = chunk_size or len(df)
+    for start in range(0, len(df), chunk_size):
+        chunk = features[start:start + chunk_size]
+        texts = np.repeat(chunk, len(meds)) + " " + np.tile(meds, len(chunk))
+        yield texts, mask[start:start + chunk_size].ravel().astype(np.int8)
+
+
+# Vocabulary of the cross-join. "features med" tokenizes to tokens(features) + tokens(med),
+# so it comes from the N + M source strings instead of all N * M rows.
+def training_vocabulary(df, meds):
+    features = (df['Kasallik nomi'] + " " + df['Belgilar']).tolist()
+    return CountVectorizer().fit(features + meds.tolist()).vocabulary_
+
+
+def train(df, chunk_size=None, n_jobs=None, n_estimators=100, test_size=0.2, random_state=42):
+    meds = medication_vocabulary(df)
+    n_rows = len(df) * len(meds)
+    train_idx, test_idx = train_test_split(np.arange(n_rows), test_size=test_size, random_state=random_state)
+    in_train = np.zeros(n_rows, dtype=bool)
+    in_train[train_idx] = True
+
+    # IDF weights come from the training rows only, streamed chunk by chunk
+    def training_texts():
+        start = 0
+        for texts, _ in iter_training_chunks(df, meds, chunk_size):
+            yield from texts[in_train[start:start + len(texts)]]
+            start += len(texts)
+
+    vectorizer = TfidfVectorizer(vocabulary=training_vocabulary(df, meds)).fit(training_texts())
+    blocks, labels = [], []
+    for texts, chunk_labels in iter_training_chunks(df, meds, chunk_size):
+        blocks.append(vectorizer.transform(texts))
+        labels.append(chunk_labels)
+    X, labels = sp.vstack(blocks).tocsr(), np.concatenate(labels)
+
+    clf = RandomForestClassifier(n_estimators=n_estimators, random_state=random_state, n_jobs=n_jobs)
+    clf.fit(X[train_idx], labels[train_idx])
+    accuracy = clf.score(X[test_idx], labels[test_idx])
+    # Same Pipeline the app (and model_artifact) expect
+    pipeline = Pipeline([('tfidf', vectorizer), ('clf', clf)])
+    return pipeline, accuracy
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Train the medication appropriateness model")
+    parser.add_argument('--csv', default='diseases.csv')
+    parser.add_argument('--chunk-size', type=int, default=None, help='diagnoses per cross-join chunk')
+    parser.add_argument('--n-jobs', type=int, default=None, help='parallel jobs for the random forest (-1 = all cores)')
+    parser.add_argument('--n-estimators', type=int, default=100)
+    args = parser.parse_args()
+
+    # Load dataset
+    df = pd.read_csv(args.csv)
+    pipeline, accuracy = train(df, args.chunk_size, args.n_jobs, args.n_estimators)
+
+    # Save the model
+    with open('medication_model.pkl', 'wb') as f:
+        pickle.dump(pipeline, f)
+
+    # Compact NumPy artifact the app loads instead of the pickle
+    export_artifact(pipeline, 'medication_model', version=model_version('medication_model.pkl'))
+
+    # Precomputed catalog scores are tied to this model version
+    build_matrix(pipeline, df, model_version('medication_model.pkl')).save()
 
-# Load dataset
-df = pd.read_csv("diseases.csv")
-
-# Prepare data: Combine diagnosis and symptoms as features
-df['features'] = df['Kasallik nomi'] + " " + df['Belgilar']
-X = df['features']
-y = df['Tavsiya etilgan dorilar'].str.split(',').explode().str.strip()
-
-# Create a binary classification dataset
-data = []
-labels = []
-for idx, row in df.iterrows():
-    diagnosis = row['features']
-    recommended_meds = [med.strip() for med in row['Tavsiya etilgan dorilar'].split(',')]
-    all_meds = set(df['Tavsiya etilgan dorilar'].str.split(',').explode().str.strip())
-    for med in all_meds:
-        data.append(diagnosis + " " + med)
-        labels.append(1 if med in recommended_meds else 0)
-
-# Vectorize and train
-pipeline = Pipeline([
-    ('tfidf', TfidfVectorizer()),
-    ('clf', RandomForestClassifier(n_estimators=100, random_state=42))
-])
-X_train, X_test, y_train, y_test = train_test_split(data, labels, test_size=0.2, random_state=42)
-pipeline.fit(X_train, y_train)
-
-# Save the model
-with open('medication_model.pkl', 'wb') as f:
-    pickle.dump(pipeline, f)
-
-# Print accuracy on test set
-print(f"Model accuracy: {pipeline.score(X_test, y_test) * 100:.2f}%")
\ No newline at end of file
+    # Print accuracy on test set
+    print(f"Model accuracy: {accuracy * 100:.2f}%")